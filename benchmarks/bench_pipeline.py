@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""End to end benchmark of Simunator's own overhead: create -> listtasks -> collect -> view ->
+delete on synthetic runsets with a trivial template and an in-process collector. Every phase runs
+in its own process, and its wall time, throughput, peak RSS and the database size after it are
+reported. Results can be saved as a baseline and later runs compared against it, exiting with
+status 1 on regressions.
+
+    python benchmarks/bench_pipeline.py --scales 100 10000 --save-baseline baseline.json
+    python benchmarks/bench_pipeline.py --scales 100 10000 --baseline baseline.json
+    python benchmarks/bench_pipeline.py --scales 1000000 --jobs 16   # ~1M directories on disk
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+phases = ["create", "listtasks", "collect", "view", "delete"]
+
+
+def config(nsims):
+    """A runset of nsims = 10 * (nsims // 10) simulations over a 10 x nsims/10 grid."""
+    return {
+        "dists": [
+            {"Uniform": {"samples": 10, "params": {"x": {"bounds": [0, 1]}}}},
+            {"Uniform": {"samples": max(1, nsims // 10), "params": {"y": {"bounds": [0, 1]}}}},
+        ],
+        "system": {
+            "templates": ["params.json"],
+            "pathstring": "sims/{{SIM_DATE}}/x{{x}}_y{{y}}",
+            "commands": {"run": "true"},
+            "collectors": {"z": {"file": "params.json", "format": "json", "key": "z"}},
+        },
+    }
+
+
+def run_phase(command, cwd):
+    """Runs command to completion and returns its wall time (s) and peak RSS (MB)."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    start = time.perf_counter()
+    proc = subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    walltime = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError("'{0}' failed".format(" ".join(command)))
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return walltime, rusage.ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def view(db, timestamp):
+    """The work SimView does for a runset: load it, filter it, fill the combo boxes and bin it."""
+    from simunator.frame import RunsetFrame, bin2d
+    from simunator.storage import connect
+
+    frame = RunsetFrame.from_db(connect(db), timestamp)
+    xvals = frame.distinct("x")
+    mask = frame.mask({"x": xvals[len(xvals) // 2]})
+    for name in ("x", "y", "z"):
+        frame.distinct(name, mask)
+    table = frame.select(frame.mask({}))
+    bin2d(table["x"], table["y"], table["z"], 200, "mean")
+
+
+def bench(nsims, jobs):
+    import yaml
+
+    simunator = [sys.executable, os.path.join(root, "bin", "simunator")]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, "bench.yaml"), "w") as f:
+            yaml.safe_dump(config(nsims), f)
+        with open(os.path.join(tmpdir, "params.json"), "w") as f:
+            f.write('{"x": {{ x }}, "y": {{ y }}, "z": {{ x * y }}}\n')
+
+        def measure(phase, command):
+            walltime, rss = run_phase(command, tmpdir)
+            dbsize = sum(
+                os.path.getsize(os.path.join(tmpdir, fname)) for fname in os.listdir(tmpdir)
+                if fname.startswith("simunator.db"))
+            results[phase] = {
+                "seconds": walltime,
+                "sims_per_s": nsims / walltime,
+                "rss_mb": rss,
+                "db_mb": dbsize / 2**20,
+            }
+
+        measure("create", simunator + ["create", "bench.yaml", "--jobs", str(jobs)])
+        timestamp = subprocess.run(
+            simunator + ["list"],
+            cwd=tmpdir,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+            env=dict(os.environ, PYTHONPATH=root),
+            check=True,
+        ).stdout.split()[0]
+        measure("listtasks", simunator + ["listtasks", timestamp, "--task-file", "tasks.txt"])
+        measure("collect", simunator + ["collect", timestamp, "--jobs", str(jobs)])
+        measure("view", [sys.executable, os.path.abspath(__file__), "--view", "simunator.db", timestamp])
+        measure("delete", simunator + ["delete", timestamp, "--jobs", str(jobs)])
+    return results
+
+
+def compare(results, baseline, tolerance, floor):
+    """Returns the (scale, phase, metric, value, baseline value) of every regression."""
+    regressions = []
+    for scale, scaleresults in results.items():
+        for phase, metrics in scaleresults.items():
+            base = baseline.get(scale, {}).get(phase)
+            if base is None:
+                continue
+            slowdown = metrics["seconds"] - base["seconds"]
+            if slowdown > base["seconds"] * tolerance and slowdown > floor:
+                regressions.append((scale, phase, "seconds", metrics["seconds"], base["seconds"]))
+            if metrics["rss_mb"] > base["rss_mb"] * (1 + tolerance):
+                regressions.append((scale, phase, "rss_mb", metrics["rss_mb"], base["rss_mb"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[100, 1000, 10000], help="Numbers of simulations")
+    parser.add_argument("--jobs", type=int, default=4, help="--jobs passed to create, collect and delete")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scale. The fastest run of each phase is kept")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON results of an earlier run to compare to")
+    parser.add_argument("--save-baseline", type=str, dest="save", default=None, help="Write the results as JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown or RSS growth")
+    parser.add_argument("--floor", type=float, default=0.1, help="Slowdowns below this many seconds are ignored")
+    parser.add_argument("--view", type=str, nargs=2, metavar=("DB", "TIMESTAMP"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.view:
+        view(*args.view)
+        return
+
+    results = {}
+    print("{0:>9} {1:>10} {2:>10} {3:>12} {4:>10} {5:>10}".format("sims", "phase", "seconds", "sims/s", "RSS MB",
+                                                                   "DB MB"))
+    for nsims in args.scales:
+        scale = str(10 * max(1, nsims // 10))
+        runs = [bench(int(scale), args.jobs) for _ in range(args.repeat)]
+        results[scale] = {
+            phase: min((run[phase] for run in runs), key=lambda metrics: metrics["seconds"])
+            for phase in phases
+        }
+        for phase in phases:
+            metrics = results[scale][phase]
+            print("{0:>9} {1:>10} {2:>10.3f} {3:>12.0f} {4:>10.1f} {5:>10.2f}".format(
+                scale, phase, metrics["seconds"], metrics["sims_per_s"], metrics["rss_mb"], metrics["db_mb"]))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.floor)
+        for scale, phase, metric, value, base in regressions:
+            print("REGRESSION {0} sims {1}: {2} {3:.3f} vs baseline {4:.3f}".format(scale, phase, metric, value, base))
+        if regressions:
+            sys.exit(1)
+        print("No regressions against {0}".format(args.baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Latency of SimView style filter queries on a synthetic runset table, with and without indexes
+on the swept parameter columns.
+
+    python benchmarks/bench_query.py --side 100   # 100^3 = 1M rows
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Run from a checkout, like the simunator subprocesses of the other benchmarks
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simunator.storage import connect, index_columns
+
+params = ["x", "y", "w"]
+
+
+def build(db, side):
+    conn = connect(db)
+    levels = np.arange(side) / side
+    grid = np.stack(np.meshgrid(levels, levels, levels, indexing="ij"), axis=-1).reshape(-1, 3)
+    conn.execute("CREATE TABLE runset ( SIM_PATH STRING, x NUMERIC, y NUMERIC, w NUMERIC, z NUMERIC );")
+    conn.executemany(
+        "INSERT INTO runset VALUES ( ?, ?, ?, ?, ? );",
+        (("sim/{0}".format(i), *point, sum(point)) for i, point in enumerate(grid.tolist())),
+    )
+    conn.commit()
+    return conn, levels
+
+
+def queries(levels):
+    """The queries SimView issues when x and y are selected in their combo boxes."""
+    x, y = levels[len(levels) // 3], levels[len(levels) // 2]
+    where = " WHERE x == {0} AND y == {1}".format(x, y)
+    return [("SELECT DISTINCT {0} FROM runset".format(param) + where) for param in params] + \
+        ["SELECT * FROM runset" + where]
+
+
+def time_queries(conn, levels, repeat):
+    timings = []
+    for query in queries(levels):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(query).fetchall()
+        timings.append((time.perf_counter() - start) / repeat)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--side", type=int, default=100, help="Levels per parameter, for side^3 rows")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions of each query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        conn, levels = build(os.path.join(tmpdir, "bench.db"), args.side)
+        print("{0} rows".format(args.side**3))
+
+        unindexed = time_queries(conn, levels, args.repeat)
+        index_columns(conn.cursor(), "runset", params)
+        conn.commit()
+        indexed = time_queries(conn, levels, args.repeat)
+
+        for query, before, after in zip(queries(levels), unindexed, indexed):
+            print("{0:>10.3f} ms -> {1:>8.3f} ms  {2}".format(1e3 * before, 1e3 * after, query))
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
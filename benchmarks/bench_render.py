@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Per-simulation template rendering cost, compiling jinja2.Template(source) for every render
+(the old behaviour of create/listtasks/collect) versus the shared compiled-template cache.
+
+    python benchmarks/bench_render.py --points 100000
+"""
+import argparse
+import itertools as it
+import os
+import sys
+import time
+
+from jinja2 import Template
+
+# Run from a checkout, like the simunator subprocesses of the other benchmarks
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simunator.templating import render
+
+pathstring = "example/{{SIM_DATE}}/x#{{x}}_y#{{y}}"
+templates = {
+    "example.py": "print({{x}} + {{y}})\n",
+    "analyze.sh": '#!/usr/bin/env bash\n\ncat "example.log" > example_analyzed.log\n',
+}
+command = "python3 example.py > example.log"
+
+
+def sweep(npoints):
+    side = int(round(npoints**0.5))
+    levels = [i / (side - 1) for i in range(side)]
+    return [{"x": x, "y": y, "SIM_DATE": "0"} for x, y in it.product(levels, levels)]
+
+
+def render_uncached(params):
+    for source in [pathstring, command, *templates.values()]:
+        Template(source).render(**params)
+
+
+def render_cached(params):
+    for source in [pathstring, command, *templates.values()]:
+        render(source, **params)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=100000, help="Number of points in the sweep")
+    args = parser.parse_args()
+
+    psets = sweep(args.points)
+    print("Rendering {0} templates for {1} sims".format(len(templates) + 2, len(psets)))
+    for name, func in (("uncached", render_uncached), ("cached", render_cached)):
+        start = time.perf_counter()
+        for params in psets:
+            func(params)
+        elapsed = time.perf_counter() - start
+        print("{0:>10}: {1:8.2f} s total, {2:8.2f} us/sim".format(name, elapsed, 1e6 * elapsed / len(psets)))
+
+
+if __name__ == "__main__":
+    main()
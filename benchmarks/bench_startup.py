@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Import time of a simunator subcommand, measured with python -X importtime. Exits with status 1
+if the median exceeds the budget or if any of the forbidden (heavy) modules gets imported, so it
+can guard against startup regressions of the subcommands that scripts call in tight loops.
+
+    python benchmarks/bench_startup.py --budget 50 list
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(command, cwd):
+    """Runs the subcommand once and returns its wall time (s), {top-level module: cumulative
+    import time (us)} and the set of all imported modules.
+    """
+    env = dict(os.environ, PYTHONPATH=root)
+    # Cached bytecode is what installed packages run from
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.join(root, "bin", "simunator")] + command,
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    walltime = time.perf_counter() - start
+
+    modules = {}
+    imported = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        imported.add(name.strip())
+        # Nested imports are indented and already counted in their parent's cumulative time
+        if not name.startswith("  "):
+            modules[name.strip()] = int(cumulative)
+    return walltime, modules, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "command",
+        nargs="*",
+        default=["list"],
+        help="Subcommand and arguments to time. It runs in an empty directory, so it must not need a batch",
+    )
+    parser.add_argument("--budget", type=float, default=50.0, help="Maximum median import time in ms")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs")
+    parser.add_argument(
+        "--forbid",
+        type=str,
+        default="numpy,jinja2,yaml",
+        help="Comma separated modules the subcommand must not import",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Creates the database and the bytecode caches
+        import_times(args.command, tmpdir)
+        runs = [import_times(args.command, tmpdir) for _ in range(args.repeat)]
+
+    total = statistics.median(sum(modules.values()) for _, modules, _ in runs) / 1e3
+    walltime = statistics.median(walltime for walltime, _, _ in runs) * 1e3
+    modules = runs[-1][1]
+    imported = set(name.split(".")[0] for _, _, names in runs for name in names)
+    forbidden = sorted(imported & set(filter(None, args.forbid.split(","))))
+
+    print("simunator {0}: {1:.1f} ms importing, {2:.1f} ms wall time (median of {3})".format(
+        " ".join(args.command), total, walltime, args.repeat))
+    for name in sorted(modules, key=modules.get, reverse=True)[:5]:
+        print("{0:>10.1f} ms  {1}".format(modules[name] / 1e3, name))
+
+    failed = False
+    if total > args.budget:
+        print("FAIL: import time exceeds the budget of {0} ms".format(args.budget))
+        failed = True
+    if forbidden:
+        print("FAIL: imports {0}".format(", ".join(forbidden)))
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,5 +12,9 @@ setup(
     license_files=('LICENSE'),
     packages=["simunator"],
     install_requires=["numpy", "jinja2"],
+    extras_require={
+        "export": ["pyarrow"],
+        "hdf5": ["h5py"],
+    },
     scripts=['bin/simunator'],
 )
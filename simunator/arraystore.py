@@ -0,0 +1,104 @@
+import os
+
+import numpy as np
+
+# Array valued collector results at least this large (in bytes) are kept out of the database
+default_threshold = 1 << 16
+
+
+class NpyStore:
+    """Stores each array as root/<timestamp>/<collector>/<rowid>.npy, read back memory-mapped."""
+    scheme = "npy"
+
+    def __init__(self, root):
+        self.root = root
+
+    def put(self, timestamp, collector, rowid, arr):
+        relpath = os.path.join(str(timestamp), collector, "{0}.npy".format(rowid))
+        path = os.path.join(self.root, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, arr)
+        return "{0}:{1}".format(self.scheme, relpath)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class HDF5Store:
+    """Stores each array as the chunked dataset /<collector>/<rowid> of root/<timestamp>.h5."""
+    scheme = "hdf5"
+
+    def __init__(self, root):
+        self.root = root
+        self.files = {}
+
+    def put(self, timestamp, collector, rowid, arr):
+        import h5py
+
+        relpath = "{0}.h5".format(timestamp)
+        if relpath not in self.files:
+            os.makedirs(self.root, exist_ok=True)
+            self.files[relpath] = h5py.File(os.path.join(self.root, relpath), "a")
+        name = "/{0}/{1}".format(collector, rowid)
+        if name in self.files[relpath]:
+            del self.files[relpath][name]
+        self.files[relpath].create_dataset(name, data=arr, chunks=True if arr.ndim else None)
+        return "{0}:{1}:{2}".format(self.scheme, relpath, name)
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+stores = {store.scheme: store for store in (NpyStore, HDF5Store)}
+
+
+def is_ref(val):
+    return isinstance(val, str) and val.split(":", 1)[0] in stores
+
+
+def load(ref, root):
+    """Opens the array behind a reference stored in the database: a read-only np.memmap for npy
+    references, and the dataset read into memory (closing its file) for hdf5 references. Other
+    values are returned unchanged.
+    """
+    if not is_ref(ref):
+        return ref
+
+    scheme, location = ref.split(":", 1)
+    if scheme == "npy":
+        return np.load(os.path.join(root, location), mmap_mode="r")
+
+    import h5py
+
+    relpath, name = location.split(":", 1)
+    with h5py.File(os.path.join(root, relpath), "r") as f:
+        return f[name][()]
+
+
+def decode(val, root):
+    """Returns the array behind a database value, whether an np.save BLOB or an array store
+    reference, and any other value unchanged.
+    """
+    if isinstance(val, bytes):
+        import io
+        return np.load(io.BytesIO(val))
+    return np.asarray(load(val, root)) if is_ref(val) else val
+
+
+def remove(root, timestamp):
+    """Removes every stored array of a simulation batch."""
+    import shutil
+
+    shutil.rmtree(os.path.join(root, str(timestamp)), ignore_errors=True)
+    h5file = os.path.join(root, "{0}.h5".format(timestamp))
+    if os.path.exists(h5file):
+        os.remove(h5file)
@@ -0,0 +1,128 @@
+import io
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+
+import numpy as np
+
+# Formats understood by file collectors, i.e. collectors specified as
+#   name: {file: 'out.npy', format: 'npy'}
+file_formats = ("text", "npy", "json")
+
+
+def dump_collector(spec):
+    """Serializes a collector spec from the input yaml for storage in simunator_collectors.
+    Shell collectors are kept as their raw command template.
+    """
+    if isinstance(spec, dict):
+        return json.dumps(spec, sort_keys=True)
+    return spec
+
+
+def load_collector(cmdtemplate):
+    """Inverse of dump_collector."""
+    if cmdtemplate.lstrip().startswith("{"):
+        try:
+            spec = json.loads(cmdtemplate)
+        except ValueError:
+            return cmdtemplate
+        if isinstance(spec, dict):
+            return spec
+    return cmdtemplate
+
+
+def render_collector(spec, render):
+    """Fills in the templated parts of a collector spec using render(template_string)."""
+    if isinstance(spec, dict):
+        if "file" in spec:
+            return {**spec, "file": render(spec["file"])}
+        return spec
+    return render(spec)
+
+
+def to_value(val):
+    # FIXME: The type of the column should set this, not the parsed result
+    return float(val) if val.size == 1 else val
+
+
+@lru_cache(maxsize=None)
+def load_callable(target):
+    """Imports the function named by a 'module:function' string."""
+    import importlib
+
+    modulename, _, funcname = target.partition(":")
+    if not funcname:
+        raise ValueError("Python collector '{0}' must be of the form 'module:function'".format(target))
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    return getattr(importlib.import_module(modulename), funcname)
+
+
+def run_shell(cmd, path):
+    import subprocess
+
+    result = subprocess.run(cmd, cwd=path, stdout=subprocess.PIPE, shell=True)
+
+    return to_value(np.loadtxt(io.StringIO(result.stdout.decode("utf-8")), delimiter=" "))
+
+
+def run_file(spec, path):
+    fmt = spec.get("format", "text")
+    fname = os.path.join(path, spec["file"])
+    if fmt == "text":
+        return to_value(np.loadtxt(fname, delimiter=spec.get("delimiter", " ")))
+    elif fmt == "npy":
+        return to_value(np.load(fname))
+    elif fmt == "json":
+        with open(fname) as f:
+            val = json.load(f)
+        if "key" in spec:
+            for key in str(spec["key"]).split("."):
+                val = val[key]
+        if isinstance(val, (list, int, float)):
+            return to_value(np.asarray(val, dtype=float))
+        return val
+    raise ValueError("Unknown collector file format '{0}'. Valid options are: {1}".format(
+        fmt, ", ".join(file_formats)))
+
+
+def run_python(spec, path, params):
+    val = load_callable(spec["python"])(path, params)
+    return to_value(val) if isinstance(val, np.ndarray) else val
+
+
+def run_collector(spec, path, params=None):
+    """Runs a single (rendered) collector from path and returns the parsed value. Lives at
+    module level so that it can be dispatched to a worker process.
+
+    Collectors are either a shell command whose stdout is parsed with np.loadtxt, or one of
+    the in-process specs
+        {python: 'module:function'}  -> function(path, params)
+        {file: 'name', format: 'text' | 'npy' | 'json', key: 'a.b'}
+    """
+    if not isinstance(spec, dict):
+        return run_shell(spec, path)
+    elif "python" in spec:
+        return run_python(spec, path, params or {})
+    elif "file" in spec:
+        return run_file(spec, path)
+    raise ValueError("Collector spec {0} needs one of 'python' or 'file'".format(spec))
+
+
+def timed_collector(spec, path, params=None):
+    """run_collector that also returns its wall time in seconds, for the collect statistics."""
+    start = time.perf_counter()
+    val = run_collector(spec, path, params)
+    return val, time.perf_counter() - start
+
+
+def try_collector(spec, path, params=None):
+    """timed_collector that does not raise. Returns (value, seconds, None) on success and
+    (None, None, error message) when the collector fails, e.g. on a simulation that has not run.
+    """
+    try:
+        return timed_collector(spec, path, params) + (None, )
+    except Exception as e:
+        return None, None, "{0}: {1}".format(type(e).__name__, e)
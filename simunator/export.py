@@ -0,0 +1,87 @@
+import numpy as np
+
+from simunator.arraystore import decode, is_ref
+
+# Formats accepted by pyarrow.dataset, with the names used on the command line
+formats = {"parquet": "parquet", "ipc": "ipc"}
+
+
+def to_column(values, arrayroot):
+    """Converts one column of sqlite values to something pyarrow can ingest, decoding arrays stored
+    as np.save BLOBs or in the array store into (flattened) lists.
+    """
+    if not any(isinstance(val, bytes) or is_ref(val) for val in values):
+        return values
+
+    column = []
+    for val in values:
+        val = decode(val, arrayroot)
+        column.append(np.ravel(val) if isinstance(val, np.ndarray) else val)
+    return column
+
+
+def runset_table(conn, timestamp, arrayroot):
+    """Reads a simulation batch into a pyarrow.Table with a leading 'runset' column."""
+    import pyarrow as pa
+
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute("SELECT rowid AS SIM_ID, * FROM '{0}';".format(timestamp))
+    names = [description[0] for description in cursor.description]
+    rows = cursor.fetchall()
+
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    arrays = [pa.array([timestamp] * len(rows), type=pa.string())]
+    arrays += [pa.array(to_column(list(values), arrayroot)) for values in columns]
+    return pa.Table.from_arrays(arrays, names=["runset"] + names)
+
+
+def unified_schema(schemas):
+    """One schema for tables whose column types pyarrow inferred separately, e.g. a collector column
+    that is all NULL (null type) in an uncollected batch and double in a collected one.
+    """
+    import pyarrow as pa
+
+    return pa.unify_schemas(schemas, promote_options="permissive")
+
+
+def export(conn, timestamps, path, fmt="parquet", arrayroot="."):
+    """Writes the given simulation batches to a dataset at path, partitioned as runset=<timestamp>.
+    Exporting a batch again replaces its partition. All batches are written with one unified schema.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    tables = [runset_table(conn, timestamp, arrayroot) for timestamp in timestamps]
+    schema = unified_schema([table.schema for table in tables]) if tables else None
+    for table in tables:
+        # Batches of different configurations keep their own columns, with the unified types
+        ds.write_dataset(
+            table.cast(pa.schema([schema.field(name) for name in table.column_names])),
+            path,
+            format=formats[fmt],
+            partitioning=["runset"],
+            partitioning_flavor="hive",
+            existing_data_behavior="delete_matching",
+        )
+
+
+def load(path, columns=None, filters=None, fmt="parquet"):
+    """Loads an exported dataset as a pyarrow.Table, reading only the requested columns and only
+    the row groups and partitions that can match filters. Filters use the DNF form of
+    pyarrow.parquet.read_table, e.g. [("runset", "==", "1600000000"), ("x", ">", 0.5)], or can be
+    a pyarrow.compute expression.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    if filters is not None and not isinstance(filters, ds.Expression):
+        filters = pq.filters_to_expression(filters)
+    partitioning = ds.partitioning(pa.schema([("runset", pa.string())]), flavor="hive")
+    dataset = ds.dataset(path, format=formats[fmt], partitioning=partitioning)
+    # Batches exported separately can still disagree on column types, and the dataset would otherwise
+    # take the types of whichever file it opens first
+    schema = unified_schema([fragment.physical_schema for fragment in dataset.get_fragments()] + [dataset.schema])
+    dataset = ds.dataset(path, schema=schema, format=formats[fmt], partitioning=partitioning)
+    return dataset.to_table(columns=columns, filter=filters)
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+
+class RunsetFrame:
+    """In-memory copy of a simulation batch for interactive filtering, as done by SimView.
+
+    Each column used in a filter is factorized once into integer codes over its sorted distinct
+    values. Equality filters and the distinct values remaining under a filter are then vectorized
+    operations on those codes instead of database queries. The boolean mask of every
+    (column, value) filter is cached.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.codes = {}
+        self.uniques = {}
+        self.masks = {}
+
+    @classmethod
+    def from_db(cls, conn, timestamp):
+        return cls(pd.read_sql_query("SELECT * FROM '{0}';".format(timestamp), conn))
+
+    def __len__(self):
+        return len(self.table)
+
+    def columns(self):
+        return list(self.table.columns)
+
+    def factorize(self, name):
+        if name not in self.codes:
+            self.codes[name], self.uniques[name] = pd.factorize(self.table[name], sort=True)
+        return self.codes[name], self.uniques[name]
+
+    def mask(self, selection):
+        """Returns the boolean mask of rows where every column in selection equals its value."""
+        mask = np.ones(len(self.table), dtype=bool)
+        for name, value in selection.items():
+            if (name, value) not in self.masks:
+                codes, uniques = self.factorize(name)
+                matches = np.flatnonzero(uniques == value)
+                self.masks[(name, value)] = codes == matches[0] if len(matches) else np.zeros_like(mask)
+            mask &= self.masks[(name, value)]
+        return mask
+
+    def distinct(self, name, mask=None):
+        """Returns the sorted distinct (non-null) values of a column among the rows in mask."""
+        codes, uniques = self.factorize(name)
+        if mask is not None:
+            codes = codes[mask]
+        present = np.bincount(codes + 1, minlength=len(uniques) + 1)[1:] > 0
+        return list(uniques[present])
+
+    def select(self, mask):
+        return self.table[mask]
+
+
+def view_limits(values, lim=None):
+    """Returns (low, high) of lim, or of the finite values when lim is None, widened when empty."""
+    if lim is None:
+        finite = values[np.isfinite(values)]
+        lim = (finite.min(), finite.max()) if len(finite) else (0.0, 1.0)
+    low, high = sorted(float(v) for v in lim)
+    return (low - 0.5, high + 0.5) if low == high else (low, high)
+
+
+def bin2d(x, y, z, bins, stat="mean", xlim=None, ylim=None):
+    """Aggregates scattered values z(x, y) on a bins x bins grid spanning xlim x ylim (default the
+    data range), with stat one of "mean", "min", "max" or "count". Returns the x and y bin edges
+    and the (bins, bins) grid indexed [x, y], NaN in bins without points.
+    """
+    x, y, z = (np.asarray(v, dtype=float) for v in (x, y, z))
+    xedges = np.linspace(*view_limits(x, xlim), bins + 1)
+    yedges = np.linspace(*view_limits(y, ylim), bins + 1)
+
+    inside = (x >= xedges[0]) & (x <= xedges[-1]) & (y >= yedges[0]) & (y <= yedges[-1]) & np.isfinite(z)
+    ix = np.minimum(((x[inside] - xedges[0]) / (xedges[-1] - xedges[0]) * bins).astype(np.int64), bins - 1)
+    iy = np.minimum(((y[inside] - yedges[0]) / (yedges[-1] - yedges[0]) * bins).astype(np.int64), bins - 1)
+    flat = ix * bins + iy
+    z = z[inside]
+
+    count = np.bincount(flat, minlength=bins * bins)
+    if stat == "count":
+        grid = count.astype(float)
+    elif stat == "mean":
+        with np.errstate(invalid="ignore", divide="ignore"):
+            grid = np.bincount(flat, weights=z, minlength=bins * bins) / count
+    else:
+        grid = np.full(bins * bins, np.nan)
+        # fmin/fmax ignore the NaN the grid starts out with
+        {"min": np.fmin, "max": np.fmax}[stat].at(grid, flat, z)
+    grid[count == 0] = np.nan
+    return xedges, yedges, grid.reshape(bins, bins)
+
+
+def downsample(x, y, npoints, xlim=None, ylim=None):
+    """Returns the indices of at most npoints of the points inside xlim x ylim (default all points).
+    When there are more, one point is kept per cell of a grid over the view, so that sparse regions
+    and outliers stay visible while dense regions are thinned out. Zooming in on a smaller view
+    therefore shows more of the points in it.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    xlim, ylim = view_limits(x, xlim), view_limits(y, ylim)
+    inside = np.flatnonzero((x >= xlim[0]) & (x <= xlim[1]) & (y >= ylim[0]) & (y <= ylim[1]))
+    if len(inside) <= npoints:
+        return inside
+
+    cells = max(1, int(np.sqrt(npoints)))
+    ix = np.minimum(((x[inside] - xlim[0]) / (xlim[1] - xlim[0]) * cells).astype(np.int64), cells - 1)
+    iy = np.minimum(((y[inside] - ylim[0]) / (ylim[1] - ylim[0]) * cells).astype(np.int64), cells - 1)
+    _, first = np.unique(ix * cells + iy, return_index=True)
+    return inside[np.sort(first)]
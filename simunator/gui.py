@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import sqlite3
+from simunator.storage import connect
+from simunator.frame import RunsetFrame, bin2d, downsample
+from PyQt5.QtCore import QThread, pyqtSignal
 from PyQt5.QtWidgets import QApplication, QWidget
 from PyQt5.QtWidgets import (
     QFormLayout,
@@ -16,23 +18,50 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
 import pandas as pd
+import numpy as np
 import os
 
 
+class RunsetLoader(QThread):
+    """Reads a simulation batch into a RunsetFrame off the GUI thread, on its own connection."""
+    loaded = pyqtSignal(str, object)
+
+    def __init__(self, db, table, parent=None):
+        QThread.__init__(self, parent)
+        self.db = db
+        self.table = table
+
+    def run(self):
+        conn = connect(self.db)
+        try:
+            frame = RunsetFrame.from_db(conn, self.table)
+        finally:
+            conn.close()
+        self.loaded.emit(self.table, frame)
+
+
 class SimView(QMainWindow):
+    # Resolution of the binned plots and number of points drawn by the downsampled scatter plot
+    plot_bins = 200
+    plot_points = 20000
+
     def __init__(self, db="simunator.db"):
         QMainWindow.__init__(self)
 
         # Get Column names
-        self.conn = sqlite3.connect(db)
-        self.conn.row_factory = sqlite3.Row
+        self.db = db
+        self.conn = connect(db)
         self.cursor = self.conn.cursor()
         self.cursor.execute("SELECT time FROM simunator_runsets;")
         self.tables = [row['time'] for row in self.cursor.fetchall()]
-        self.cursor.execute("SELECT * FROM '{}' ;".format(self.tables[0]))
+        self.cursor.execute("SELECT * FROM '{}' LIMIT 1;".format(self.tables[0]))
         self.box_names = list(filter(lambda x: x[0:4] != 'SIM_', self.cursor.fetchone().keys()))
         self.curr_vals = dict()
 
+        # The selected runset, filtered in memory once loaded by a RunsetLoader
+        self.frame = None
+        self.loader = None
+
         self.setWindowTitle("SimView")
 
         centralWidget = QWidget(self)
@@ -48,7 +77,7 @@ class SimView(QMainWindow):
         for table in self.tables:
             self.table_box.addItem(table)
 
-        self.table_box.currentIndexChanged.connect(self.selection_change)
+        self.table_box.currentIndexChanged.connect(self.table_change)
         self.selector_layout.addRow("table", self.table_box)
 
         # Create combobox and add items.
@@ -76,8 +105,6 @@ class SimView(QMainWindow):
             self.boxes[name] = newbox
             self.checkboxes[name] = newcheckbox
 
-        self.update_combo_boxes()
-
         # Plot space
         self.plot_layout = QVBoxLayout()
         self.figure = Figure()
@@ -89,6 +116,10 @@ class SimView(QMainWindow):
             # "CSV": self.plotCSV,
             "Value (pcolor)": self.plot_value_pcolor,
             "Value": self.plot_value,
+            "Value (downsampled)": self.plot_value_downsampled,
+            "Binned mean": lambda: self.plot_binned("mean"),
+            "Binned min": lambda: self.plot_binned("min"),
+            "Binned max": lambda: self.plot_binned("max"),
         }
 
         # plot function box
@@ -153,28 +184,48 @@ class SimView(QMainWindow):
 
         self.block_selection_change = False
 
+        self.load_table(self.table_name)
+
+    def load_table(self, table):
+        self.table_name = table
+        self.frame = None
+        self.plot_button.setEnabled(False)
+        self.loader = RunsetLoader(self.db, table, self)
+        self.loader.loaded.connect(self.table_loaded)
+        self.loader.start()
+
+    def table_loaded(self, table, frame):
+        # Results of loaders for a previously selected table are dropped
+        if table != self.table_name:
+            return
+        self.frame = frame
+        self.update_combo_boxes()
+        self.plot_button.setEnabled(True)
+
+    def table_change(self, i):
+        if not self.block_selection_change and self.table_box.currentText() != self.table_name:
+            self.load_table(self.table_box.currentText())
+
     def collect_groups(self):
         self.plot_groups = list()
         for key, val in self.checkboxes.items():
             if val.isChecked():
                 self.plot_groups.append(key)
 
-    def build_SQL_query(self):
-        filterFlag = False
-        query_template = "SELECT {} {} FROM '{}'"
-        for key, box in self.boxes.items():
-            if box.currentText() != "<any>":
-                if filterFlag:
-                    query_template += " AND "
-                else:
-                    query_template += " WHERE "
-                query_template += "{} == {}".format(key, box.currentText())
-                filterFlag = True
-        return query_template
+    def selection(self):
+        """Returns {parameter: value} of the combo boxes not set to <any>."""
+        return {
+            key: self.curr_vals[key][box.currentIndex() - 1]
+            for key, box in self.boxes.items() if box.currentIndex() > 0
+        }
 
     def update_combo_boxes(self):
+        if self.frame is None:
+            return
+
         self.block_selection_change = True
-        query_template = self.build_SQL_query()
+        mask = self.frame.mask(self.selection())
+        columns = self.frame.columns()
 
         for key, box in self.boxes.items():
             currText = box.currentText()
@@ -182,15 +233,12 @@ class SimView(QMainWindow):
             box.clear()
             box.addItem("<any>")
 
-            mainquery = query_template.format("DISTINCT", boxname, self.table_name)
-
-            self.cursor = self.conn.execute(mainquery)
-            self.curr_vals[boxname] = [row[boxname] for row in self.cursor.fetchall()]
+            self.curr_vals[boxname] = self.frame.distinct(boxname, mask) if boxname in columns else []
             box.addItems(
                 [str(val) if not isinstance(val, str) else '"{}"'.format(val) for val in self.curr_vals[boxname]])
             box.setCurrentText(currText)
 
-        self.sim_table = pd.read_sql_query(query_template.format("*", "", self.table_name), self.conn)
+        self.sim_table = self.frame.select(mask)
 
         self.block_selection_change = False
 
@@ -199,7 +247,7 @@ class SimView(QMainWindow):
             self.update_combo_boxes()
 
     def plot_button_handler(self):
-        self.sim_table = pd.read_sql_query(self.build_SQL_query().format("*", "", self.table_name), self.conn)
+        self.sim_table = self.frame.select(self.frame.mask(self.selection()))
 
         self.plot_funcs[self.plot_box.currentText()]()
 
@@ -238,15 +286,20 @@ class SimView(QMainWindow):
         x_field = self.x_axis_box.currentText()
         y_field = self.y_axis_box.currentText()
         z_field = self.z_axis_box.currentText()
+
+        xdatasize = self.sim_table[x_field].nunique()
+        ydatasize = self.sim_table[y_field].nunique()
+        # Only complete rectangular grids can be reshaped, so scattered designs are binned instead
+        if xdatasize * ydatasize != len(self.sim_table):
+            self.plot_binned("mean")
+            return
+
         sortlist = self.plot_groups + [x_field, y_field]
         self.sim_table = self.sim_table.sort_values(by=sortlist)
 
         self.figure.clear()
         ax = self.figure.add_subplot(111)
 
-        import numpy as np
-        xdatasize = len(set(self.sim_table[x_field]))
-        ydatasize = len(set(self.sim_table[y_field]))
         xdata = np.array(self.sim_table[x_field]).reshape(xdatasize, ydatasize)
         ydata = np.array(self.sim_table[y_field]).reshape(xdatasize, ydatasize)
         zdata = np.array(self.sim_table[z_field]).reshape(xdatasize, ydatasize)
@@ -258,6 +311,76 @@ class SimView(QMainWindow):
 
         self.canvas.draw()
 
+    def plot_value_downsampled(self):
+        """Scatter plot of at most plot_points points, redrawn from all selected points whenever the
+    view is zoomed or panned, so that zooming in reveals the points that were thinned out.
+        """
+        x_field = self.x_axis_box.currentText()
+        y_field = self.y_axis_box.currentText()
+        x = self.sim_table[x_field].to_numpy(dtype=float)
+        y = self.sim_table[y_field].to_numpy(dtype=float)
+        groups = self.sim_table.groupby(self.plot_groups).ngroup().to_numpy() if self.plot_groups else None
+
+        self.figure.clear()
+        ax = self.figure.add_subplot(111)
+
+        keep = downsample(x, y, self.plot_points)
+        points = ax.scatter(x[keep], y[keep], s=4, c=None if groups is None else groups[keep], cmap="tab10")
+
+        def refine(ax):
+            keep = downsample(x, y, self.plot_points, ax.get_xlim(), ax.get_ylim())
+            points.set_offsets(np.column_stack([x[keep], y[keep]]))
+            if groups is not None:
+                points.set_array(groups[keep])
+
+        ax.callbacks.connect("xlim_changed", refine)
+        ax.callbacks.connect("ylim_changed", refine)
+
+        ax.set_xlabel(x_field)
+        ax.set_ylabel(y_field)
+        self.canvas.draw()
+
+    def plot_binned(self, stat):
+        """Image of the stat (mean, min or max) of zAxis over a plot_bins x plot_bins grid, which works
+    for scattered designs and partial collections alike. Zooming re-bins the visible range.
+        """
+        x_field = self.x_axis_box.currentText()
+        y_field = self.y_axis_box.currentText()
+        z_field = self.z_axis_box.currentText()
+        x = self.sim_table[x_field].to_numpy(dtype=float)
+        y = self.sim_table[y_field].to_numpy(dtype=float)
+        z = pd.to_numeric(self.sim_table[z_field], errors="coerce").to_numpy(dtype=float)
+
+        self.figure.clear()
+        ax = self.figure.add_subplot(111)
+
+        xedges, yedges, grid = bin2d(x, y, z, self.plot_bins, stat)
+        image = ax.imshow(
+            grid.T,
+            origin="lower",
+            aspect="auto",
+            interpolation="nearest",
+            extent=(xedges[0], xedges[-1], yedges[0], yedges[-1]),
+        )
+        # Keeps set_extent below from changing the limits it is reacting to
+        ax.set_autoscale_on(False)
+
+        def refine(ax):
+            xedges, yedges, grid = bin2d(x, y, z, self.plot_bins, stat, ax.get_xlim(), ax.get_ylim())
+            image.set_data(grid.T)
+            image.set_extent((xedges[0], xedges[-1], yedges[0], yedges[-1]))
+            image.autoscale()
+
+        ax.callbacks.connect("xlim_changed", refine)
+        ax.callbacks.connect("ylim_changed", refine)
+
+        ax.set_xlabel(x_field)
+        ax.set_ylabel(y_field)
+        ax.set_title("{0} of {1}".format(stat, z_field))
+        self.figure.colorbar(image)
+
+        self.canvas.draw()
+
 
 if __name__ == "__main__":
     import sys
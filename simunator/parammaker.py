@@ -12,18 +12,89 @@ class ParamMaker:
             self._params = indist[self._disttype]["params"]
             if "samples" in indist[self._disttype]:
                 self._samples = indist[self._disttype]["samples"]
+            # Options of the space filling designs (Halton, Sobol, LatinHypercube)
+            self._skip = indist[self._disttype].get("skip")
+            self._seed = indist[self._disttype].get("seed")
+            self._scramble = indist[self._disttype].get("scramble", False)
             self.build_generator()
 
     @classmethod
     def from_param_makers(self, *args):
         self._disttype = "Combo"
         self._params = self.flatten([pm._params for pm in args])
-        self._generator = it.product(*[pm._generator for pm in args])
+        self._makers = args
         return self
 
     def actualize(self):
         return self._params, [tuple(self.flatten(tup)) for tup in self.items()]
 
+    def actualize_array(self):
+        """Array backed equivalent of actualize. Returns the parameter names and a structured
+    array with one field per parameter, in the same order as actualize.
+        """
+        return self.param_names(), next(self.iter_arrays())
+
+    def param_names(self):
+        makers = self._makers if self._disttype == "Combo" else [self]
+        return self.flatten([list(pm._params) for pm in makers])
+
+    def iter_arrays(self, chunksize=None):
+        """Yields the points of actualize_array as structured arrays of at most chunksize rows.
+    Only the per-distribution arrays are held in full, so memory is bounded by the chunk
+    size rather than by the size of the cartesian product.
+        """
+        makers = self._makers if self._disttype == "Combo" else [self]
+        arrays = [pm.build_array() for pm in makers]
+        names = [list(pm._params) for pm in makers]
+        dtype = [(name, column.dtype) for columns, pmnames in zip(arrays, names)
+                 for name, column in zip(pmnames, columns)]
+
+        # Row n of the cartesian product is the C-order unraveling of n, so the last maker varies
+        # fastest, like it.product
+        shape = tuple(len(columns[0]) for columns in arrays)
+        total = int(np.prod(shape))
+        chunksize = chunksize or max(total, 1)
+        for start in range(0, max(total, 1), chunksize):
+            indices = np.unravel_index(np.arange(start, min(start + chunksize, total)), shape)
+            psets = np.empty(len(indices[0]), dtype=dtype)
+            for columns, pmnames, index in zip(arrays, names, indices):
+                for name, column in zip(pmnames, columns):
+                    psets[name] = column[index]
+            yield psets
+
+    def size(self):
+        """Number of points in the (cartesian product of) distribution(s)."""
+        makers = self._makers if self._disttype == "Combo" else [self]
+        return int(np.prod([pm.nsamples() for pm in makers]))
+
+    def nsamples(self):
+        if self._disttype in ("ItemizedList", "Points"):
+            return len(self._params[list(self._params.keys())[0]])
+        return self._samples
+
+    def build_array(self):
+        """Returns all N points of this distribution as a list of d columns (length N arrays).
+    Columns have their own dtypes, so that converting back with tolist gives the same python
+    types as actualize.
+        """
+        if self._disttype == "RandUniform":
+            return list(self.rand_uniform_array([val["bounds"] for _, val in self._params.items()], self._samples).T)
+        elif self._disttype == "Uniform":
+            return self.lin_uniform_columns([val["bounds"] for _, val in self._params.items()], self._samples)
+        elif self._disttype == "ItemizedList":
+            param = list(self._params.keys())[0]
+            return [self.column(self._params[param])]
+        elif self._disttype == "Halton":
+            return list(self.halton_array([val["bounds"] for _, val in self._params.items()], self._samples).T)
+        elif self._disttype == "Sobol":
+            return list(self.sobol_array([val["bounds"] for _, val in self._params.items()], self._samples).T)
+        elif self._disttype == "LatinHypercube":
+            return list(
+                self.latin_hypercube_array([val["bounds"] for _, val in self._params.items()], self._samples).T)
+        elif self._disttype == "Points":
+            return [self.column(values) for values in self._params.values()]
+        raise ValueError("Unknown distribution type '{0}'".format(self._disttype))
+
     def build_generator(self):
         if self._disttype == "RandUniform":
             self._generator = self.rand_uniform([val["bounds"] for _, val in self._params.items()], self._samples)
@@ -32,21 +103,50 @@ class ParamMaker:
         elif self._disttype == "ItemizedList":
             param = list(self._params.keys())[0]
             self._generator = ([el] for el in self._params[param])
-        elif self._disttype == "Halton":
-            param = list(self._params.keys())[0]
-            self._generator = self.halton([val["bounds"] for _, val in self._params.items()], self._samples)
+        elif self._disttype in ("Halton", "Sobol", "LatinHypercube", "Points"):
+            self._generator = self.array_rows()
 
-    def halton(self, bounds, N):
-        import chaospy
-        dim = len(self._params)
-        unscaled = chaospy.distributions.sampler.sequences.halton.create_halton_samples(N, dim)
-        for i in range(0, N):
-            yield [bounds[j][0] + (bounds[j][1] - bounds[j][0]) * unscaled[j][i] for j in range(dim)]
+    def array_rows(self):
+        yield from (list(row) for row in zip(*[column.tolist() for column in self.build_array()]))
+
+    @staticmethod
+    def scale(bounds, unscaled):
+        lower, upper = np.asarray(bounds, dtype=float).T
+        return lower + (upper - lower) * unscaled
+
+    def halton_array(self, bounds, N):
+        from simunator.sequences import halton
+        return self.scale(bounds, halton(N, len(bounds), self._skip or 0, self._scramble, self._seed))
+
+    def sobol_array(self, bounds, N):
+        from simunator.sequences import sobol
+        return self.scale(bounds, sobol(N, len(bounds), self._skip or 0, self._scramble, self._seed))
+
+    def latin_hypercube_array(self, bounds, N):
+        from simunator.sequences import latin_hypercube
+        if self._skip:
+            raise ValueError("LatinHypercube designs can not be extended with skip")
+        return self.scale(bounds, latin_hypercube(N, len(bounds), self._seed))
+
+    @staticmethod
+    def column(values):
+        """Array of a list of values. Lists mixing python types (e.g. [1, 2.5] or ["a", 1]) are
+    kept as object arrays, since numpy would otherwise promote every value to a common type.
+        """
+        if len(set(type(val) for val in values)) > 1:
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+            return column
+        return np.asarray(values)
 
     def rand_uniform(self, bounds, N):
         for i in range(0, N):
             yield [np.random.uniform(*bound) for bound in bounds]
 
+    def rand_uniform_array(self, bounds, N):
+        lower, upper = np.asarray(bounds, dtype=float).T
+        return np.random.uniform(lower, upper, size=(N, len(bounds)))
+
     def lin_uniform(self, bounds, N):
         for i in range(0, N):
             point = []
@@ -55,6 +155,13 @@ class ParamMaker:
                 point.append(bound[0] + slope * i)
             yield point
 
+    def lin_uniform_columns(self, bounds, N):
+        # A single sample is the lower bound itself, so integer bounds stay integers like in lin_uniform
+        if N == 1:
+            return [self.column([bound[0]]) for bound in bounds]
+        lower, upper = np.asarray(bounds, dtype=float).T
+        return list((lower + (upper - lower) / (N - 1) * np.arange(N)[:, np.newaxis]).T)
+
     def itemized_list(self, inlist):
         return (el for el in inlist)
 
@@ -63,4 +170,7 @@ class ParamMaker:
         return [item for sublist in l for item in sublist]
 
     def items(self):
+        if self._disttype == "Combo":
+            # Built on demand so that the array path never consumes the component generators
+            return it.product(*[pm._generator for pm in self._makers])
         return self._generator
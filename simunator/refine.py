@@ -0,0 +1,63 @@
+import numpy as np
+
+
+def nearest_neighbors(x, k):
+    """Returns the (n, k) indices of the k nearest neighbors of every row of x, excluding itself.
+    Uses scipy's cKDTree when available and a chunked brute force search otherwise.
+    """
+    k = min(k, len(x) - 1)
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        cKDTree = None
+
+    if cKDTree is not None:
+        _, neighbors = cKDTree(x).query(x, k + 1)
+        return neighbors[:, 1:]
+
+    neighbors = np.empty((len(x), k), dtype=np.int64)
+    chunk = max(1, 2**22 // max(len(x), 1))
+    for start in range(0, len(x), chunk):
+        dist2 = ((x[start:start + chunk, np.newaxis, :] - x[np.newaxis, :, :])**2).sum(axis=-1)
+        dist2[np.arange(len(dist2)), np.arange(start, start + len(dist2))] = np.inf
+        nearest = np.argpartition(dist2, k - 1, axis=1)[:, :k] if k < len(x) - 1 else np.argsort(dist2, axis=1)[:, :k]
+        neighbors[start:start + chunk] = nearest
+    return neighbors
+
+
+def refine_points(points, values, nsamples, nneighbors):
+    """Proposes up to nsamples new points where values changes the most between neighboring points.
+
+    Every point is connected to its nneighbors nearest neighbors (in coordinates scaled to the
+    unit cube), each edge is scored by the change of values across it, and the midpoints of the
+    highest scoring edges are returned. Edges without any change are never split.
+
+    Returns the (m, d) array of new points and the index of the existing point each was split off
+    from.
+    """
+    points = np.asarray(points, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if len(points) < 2:
+        return np.empty((0, points.shape[1])), np.empty(0, dtype=np.int64)
+
+    lower, upper = points.min(axis=0), points.max(axis=0)
+    span = np.where(upper > lower, upper - lower, 1.0)
+    scaled = (points - lower) / span
+
+    neighbors = nearest_neighbors(scaled, nneighbors)
+    first = np.repeat(np.arange(len(points)), neighbors.shape[1])
+    second = neighbors.ravel()
+    edges = np.unique(np.stack([np.minimum(first, second), np.maximum(first, second)], axis=1), axis=0)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+
+    score = np.abs(values[edges[:, 0]] - values[edges[:, 1]])
+    order = np.argsort(-score, kind="stable")
+    edges = edges[order[score[order] > 0]]
+
+    midpoints = 0.5 * (points[edges[:, 0]] + points[edges[:, 1]])
+    _, unique = np.unique(midpoints, axis=0, return_index=True)
+    unique = np.sort(unique)
+    existing = set(map(tuple, points))
+    unique = [i for i in unique if tuple(midpoints[i]) not in existing][:nsamples]
+
+    return midpoints[unique], edges[unique, 0]
@@ -0,0 +1,115 @@
+import numpy as np
+
+# Primitive polynomials and initial direction numbers for Sobol dimensions 2..21, from Joe & Kuo's
+# new-joe-kuo-6.21201 table: (degree s, coefficients a, initial direction numbers m_1..m_s)
+sobol_table = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]),
+    (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]),
+    (5, 14, [1, 3, 5, 5, 31]),
+    (6, 1, [1, 3, 3, 9, 7, 49]),
+    (6, 13, [1, 1, 1, 15, 21, 21]),
+    (6, 16, [1, 3, 1, 13, 27, 49]),
+    (6, 19, [1, 1, 1, 15, 7, 5]),
+    (6, 22, [1, 3, 1, 15, 13, 25]),
+    (6, 25, [1, 1, 5, 5, 19, 61]),
+    (7, 1, [1, 3, 7, 11, 23, 15, 103]),
+    (7, 4, [1, 3, 7, 13, 13, 15, 69]),
+]
+
+sobol_bits = 30
+
+
+def primes(n):
+    """Returns the first n primes."""
+    found = []
+    candidate = 2
+    while len(found) < n:
+        if all(candidate % p for p in found if p * p <= candidate):
+            found.append(candidate)
+        candidate += 1
+    return found
+
+
+def halton(N, dim, skip=0, scramble=False, seed=None):
+    """Returns points skip + 1, ..., skip + N of the dim dimensional Halton sequence, after a burn-in
+    of the largest base used (as in chaospy), as an (N, dim) array in the unit cube. A design of N
+    points is thus extended by the next call with skip=N. With scramble, all digits of each base,
+    including 0, are randomly permuted.
+    """
+    bases = primes(dim)
+    skip += max(bases, default=0)
+    rng = np.random.default_rng(seed)
+
+    out = np.zeros((N, dim))
+    for j, base in enumerate(bases):
+        perm = rng.permutation(base) if scramble else np.arange(base)
+        idx = np.arange(skip + 1, skip + N + 1, dtype=np.int64)
+        ndigits = 1
+        while base**ndigits <= skip + N:
+            ndigits += 1
+        scale = float(base)
+        for _ in range(ndigits):
+            out[:, j] += perm[idx % base] / scale
+            idx //= base
+            scale *= base
+        # The infinitely many zero digits past the leading one each contribute perm[0], which sums to
+        # perm[0] / (base - 1) in units of the last digit
+        out[:, j] += perm[0] / (scale / base * (base - 1))
+    return out
+
+
+def sobol_directions(dim):
+    if dim > len(sobol_table) + 1:
+        raise ValueError("Sobol sequences are only available up to {0} dimensions".format(len(sobol_table) + 1))
+
+    directions = np.zeros((sobol_bits, dim), dtype=np.uint64)
+    directions[:, 0] = [1 << (sobol_bits - 1 - i) for i in range(sobol_bits)]
+    for j, (s, a, m) in enumerate(sobol_table[:dim - 1], 1):
+        v = [mi << (sobol_bits - 1 - i) for i, mi in enumerate(m)]
+        for i in range(s, sobol_bits):
+            vi = v[i - s] ^ (v[i - s] >> s)
+            for k in range(1, s):
+                vi ^= ((a >> (s - 1 - k)) & 1) * v[i - k]
+            v.append(vi)
+        directions[:, j] = v[:sobol_bits]
+    return directions
+
+
+def sobol(N, dim, skip=0, scramble=False, seed=None):
+    """Returns points skip, ..., skip + N - 1 of the dim dimensional Sobol sequence (in Gray code
+    order, starting from the origin) as an (N, dim) array in the unit cube. With scramble, each
+    dimension is XORed with a random digital shift.
+    """
+    if skip + N > 2**sobol_bits:
+        raise ValueError("Sobol sequences are limited to 2**{0} points".format(sobol_bits))
+
+    directions = sobol_directions(dim)
+    n = np.arange(skip, skip + N, dtype=np.uint64)
+    gray = n ^ (n >> np.uint64(1))
+    out = np.zeros((N, dim), dtype=np.uint64)
+    for i in range(sobol_bits):
+        bit = ((gray >> np.uint64(i)) & np.uint64(1)).astype(bool)
+        out[bit] ^= directions[i]
+
+    if scramble:
+        shift = np.random.default_rng(seed).integers(0, 2**sobol_bits, size=dim, dtype=np.uint64)
+        out ^= shift
+    return out / float(2**sobol_bits)
+
+
+def latin_hypercube(N, dim, seed=None):
+    """Returns an (N, dim) Latin hypercube design in the unit cube, one point per stratum of each
+    dimension, jittered uniformly within its stratum.
+    """
+    rng = np.random.default_rng(seed)
+    strata = rng.permuted(np.tile(np.arange(N), (dim, 1)), axis=1).T
+    return (strata + rng.random((N, dim))) / N
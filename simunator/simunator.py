@@ -1,30 +1,56 @@
 #!/usr/bin/env python3
 import sys
 import os
-from simunator.parammaker import ParamMaker
 import sqlite3
 import time
-import argparse
-import numpy as np
-from jinja2 import Template
-import io
+from simunator.storage import connect, index_columns
+from simunator.stats import PhaseTimer
+import itertools as it
+
+# numpy, jinja2 and the modules built on them are imported by the methods that need them, which
+# keeps the startup of light subcommands like list, run and delete fast
 
 
 class Simunator:
     db = "simunator.db"
+    journal_mode = "WAL"
+    collect_batch_size = 1000
+    # Longest time (in seconds) pipeline results are held before being committed
+    stream_interval = 5.0
+    shared_dir = ".simunator_shared"
+    array_dir = ".simunator_arrays"
 
-    def __init__(self, args):
-        self.add_custom_sqlite_types()
+    def __init__(self, args=None, db=None):
+        """Runs a single command line action when given args, e.g. Simunator(sys.argv[1:]).
+    Otherwise Simunator(db=...) is used as a library through create, collect, tasks and
+    results, which share one database connection across calls.
+        """
+        if db is not None:
+            self.db = db
+        self.conn = None
+        self.timer = PhaseTimer()
+
+        if args is None:
+            return
 
         actions = {
-            "create": self.create,
+            "create": self.create_cmd,
             "list": self.list_sims,
             "delete": self.delete,
-            "collect": self.collect,
+            "collect": self.collect_cmd,
             "listtasks": self.gen_tasks,
+            "run": self.run_tasks,
+            "pipeline": self.pipeline,
             "modify": self.modify,
+            "refine": self.refine,
+            "migrate": self.migrate,
+            "export": self.export_runsets,
+            "stats": self.show_stats,
         }
 
+        # --profile may be given to any action, and prints a cProfile report when it finishes
+        profile = "--profile" in args
+        args = [arg for arg in args if arg != "--profile"]
         command = args[0] if len(args) else ""
         args = args[1:]
 
@@ -35,12 +61,31 @@ class Simunator:
                 file=sys.stderr,
             )
             sys.exit(1)
+        elif profile:
+            import cProfile
+            from simunator.stats import print_profile
+
+            profiler = cProfile.Profile()
+            try:
+                profiler.runcall(actions[command], args)
+            finally:
+                print_profile(profiler)
         else:
             actions[command](args)
 
-        self.conn.commit()
+        if self.conn is not None:
+            self.conn.commit()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
 
     def add_custom_sqlite_types(self):
+        import io
+        import numpy as np
+
         def adapt_array(arr):
             out = io.BytesIO()
             np.save(out, arr)
@@ -69,36 +114,153 @@ class Simunator:
             ["{timestamp}  ({gmt} GMT)".format(timestamp=tup[0], gmt=gmt(tup[0])) for tup in self.c.fetchall()]))
 
     def delete(self, args):
-        parser = argparse.ArgumentParser(description="Delete simulation batch.")
-        parser.add_argument("timestamp", type=str, help="Timestamp to process")
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Delete simulation batches.")
+        parser.add_argument("timestamps", type=str, nargs="*", help="Timestamps to delete")
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            dest="jobs",
+            help="Number of threads removing simulation directories. Default is the number of cores",
+            default=os.cpu_count(),
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Also finish every previously interrupted delete",
+        )
         parsedargs = parser.parse_args(args)
 
         self.get_db()
 
-        self.c.execute("SELECT * from '{0}';".format(parsedargs.timestamp))
-        sims = self.c.fetchall()
-        paramlist = sims[0].keys()
+        timestamps = list(parsedargs.timestamps)
+        if parsedargs.resume:
+            self.c.execute("SELECT time FROM simunator_trash ORDER BY deleted;")
+            timestamps += [row[0] for row in self.c.fetchall() if row[0] not in timestamps]
 
-        for paramvals in sims:
-            parammap = {
-                **dict(zip(paramlist, paramvals)),
-                **{
-                    "SIM_DATE": parsedargs.timestamp
-                },
-            }
-            path = parammap["SIM_PATH"]
+        for timestamp in timestamps:
+            self.c.execute("SELECT time FROM simunator_runsets WHERE time == ?;", (timestamp, ))
+            if self.c.fetchall():
+                self.trash_runset(timestamp)
+            else:
+                self.c.execute("SELECT time FROM simunator_trash WHERE time == ?;", (timestamp, ))
+                if not self.c.fetchall():
+                    print("Invalid timestamp: {0}".format(timestamp), file=sys.stderr)
+                    continue
+                print("Resuming delete of {0}".format(timestamp))
+            self.purge_runset(timestamp, jobs=parsedargs.jobs)
 
-            import shutil
+    def trash_runset(self, timestamp):
+        """Marks a simulation batch as deleted in a single transaction, which hides it from list
+    (and the GUI) right away. Its data is removed afterwards by purge_runset.
+        """
+        with self.conn:
+            self.c.execute("INSERT OR REPLACE INTO simunator_trash VALUES ( ?, ? );", (timestamp, time.time()))
+            self.c.execute("DELETE FROM simunator_runsets WHERE time=?;", (timestamp, ))
 
+    def purge_runset(self, timestamp, jobs=1):
+        """Removes the simulation directories and database records of a trashed batch. Directories
+    are removed from a pool of jobs threads. Interrupted or partially failed purges leave the
+    batch in simunator_trash, so running delete again picks up where it left off.
+        """
+        import shutil
+        from concurrent.futures import ThreadPoolExecutor
+        from simunator.arraystore import remove as remove_arrays
+
+        def remove(path):
             try:
-                shutil.rmtree(path)
+                # Simulations created with create --reuse link are symlinks to another batch's directory
+                if os.path.islink(path):
+                    os.unlink(path)
+                else:
+                    shutil.rmtree(path)
+            except FileNotFoundError:
+                pass
             except OSError as e:
-                print("Error: {0} - {1}.".format(e.filename, e.strerror))
+                print("Error: {0} - {1}.".format(e.filename, e.strerror), file=sys.stderr)
+                return False
+            return True
+
+        self.c.execute("SELECT name FROM sqlite_master WHERE type == 'table' AND name == ?;", (timestamp, ))
+        paths = []
+        if self.c.fetchall():
+            self.c.execute("SELECT SIM_PATH FROM '{0}';".format(timestamp))
+            paths = [row[0] for row in self.c.fetchall()]
+            if not self.copy_linked(timestamp):
+                print("Could not copy the simulations other batches link to, run delete again to retry",
+                      file=sys.stderr)
+                return
+
+        nfailed = 0
+        reportevery = max(1, len(paths) // 10)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for n, removed in enumerate(executor.map(remove, paths), 1):
+                nfailed += not removed
+                if n % reportevery == 0 or n == len(paths):
+                    print("Removed {0}/{1} simulations".format(n - nfailed, len(paths)))
+
+        if nfailed:
+            print("{0} simulations of {1} could not be removed, run delete again to retry".format(nfailed, timestamp),
+                  file=sys.stderr)
+            return
 
-        self.c.execute("DROP TABLE '{0}';".format(parsedargs.timestamp))
-        self.c.execute("DELETE FROM simunator_runsets WHERE time=?;", (parsedargs.timestamp, ))
+        shutil.rmtree(os.path.join(self.shared_dir, timestamp), ignore_errors=True)
+        remove_arrays(self.array_root(), timestamp)
+
+        with self.conn:
+            self.c.execute("DROP TABLE IF EXISTS '{0}';".format(timestamp))
+            self.c.execute("DELETE FROM simunator_collections WHERE time=?;", (timestamp, ))
+            self.c.execute("DELETE FROM simunator_tasks WHERE time=?;", (timestamp, ))
+            self.c.execute("DELETE FROM simunator_links WHERE time=?;", (timestamp, ))
+            self.c.execute("DELETE FROM simunator_runset_commands WHERE time=?;", (timestamp, ))
+            self.c.execute("DELETE FROM simunator_stats WHERE time=?;", (timestamp, ))
+            self.c.execute("DELETE FROM simunator_timings WHERE time=?;", (timestamp, ))
+            for table in ("simunator_sims", "simunator_params", "simunator_results"):
+                self.c.execute("DELETE FROM {0} WHERE runset=?;".format(table), (timestamp, ))
+            self.c.execute("DELETE FROM simunator_trash WHERE time=?;", (timestamp, ))
+        print("Deleted simulation batch {0}".format(timestamp))
+
+    def copy_linked(self, timestamp):
+        """Replaces the simulations of other live batches that are symlinks (create --reuse link) into
+    the directories of a batch with copies of those directories, so that they survive its deletion.
+    Returns False if any copy failed.
+        """
+        import shutil
+
+        if "SIM_HASH" not in self.table_columns(timestamp):
+            return True
+
+        # Simulations are only ever linked to simulations with the same SIM_HASH
+        links = []
+        self.c.execute("SELECT time FROM simunator_runsets WHERE time != ?;", (timestamp, ))
+        for other in [row[0] for row in self.c.fetchall()]:
+            if "SIM_HASH" not in self.table_columns(other):
+                continue
+            self.c.execute(
+                "SELECT o.SIM_PATH, n.SIM_PATH FROM '{0}' AS o JOIN '{1}' AS n ON o.SIM_HASH == n.SIM_HASH;".format(
+                    other, timestamp))
+            links += [(path, source) for path, source in self.c.fetchall()
+                      if os.path.islink(path) and os.path.realpath(path) == os.path.realpath(source)]
+
+        ok = True
+        for path, source in links:
+            tmppath = path + ".simunator_copy"
+            try:
+                shutil.rmtree(tmppath, ignore_errors=True)
+                shutil.copytree(os.path.realpath(source), tmppath, symlinks=True)
+                os.unlink(path)
+                os.rename(tmppath, path)
+            except OSError as e:
+                print("Error copying {0} to {1}: {2}".format(source, path, e), file=sys.stderr)
+                ok = False
+        if links:
+            print("Copied {0} simulations of other batches that linked into {1}".format(len(links), timestamp))
+        return ok
 
     def gen_tasks(self, args):
+        import argparse
+
         parser = argparse.ArgumentParser(description="Generate list of tasks for a given simulation set.")
         parser.add_argument("timestamp", type=str, help="Timestamp to process")
         parser.add_argument(
@@ -115,49 +277,563 @@ class Simunator:
             dest="command",
             default="run",
         )
+        parser.add_argument(
+            "--bundle",
+            type=int,
+            help="Number of simulations to group into each task",
+            dest="bundle",
+            default=1,
+        )
+        parser.add_argument(
+            "--cost",
+            type=str,
+            help="Expression of the parameters estimating a simulation's cost, used to balance bundles",
+            dest="cost",
+            default=None,
+        )
+        parser.add_argument(
+            "--bundle-dir",
+            type=str,
+            help="Write each bundle to <bundle-dir>/bundle_<i>.sh and emit one task per script",
+            dest="bundledir",
+            default=None,
+        )
+        parser.add_argument(
+            "--skip-known",
+            action="store_true",
+            dest="skipknown",
+            help="Skip simulations whose SIM_HASH occurs in another batch where this command succeeded",
+        )
         parsedargs = parser.parse_args(args)
 
         outfile = open(parsedargs.taskfile, "w") if parsedargs.taskfile else sys.stdout
 
         self.get_db()
 
+        skip = self.memoized(parsedargs.timestamp, commands=[parsedargs.command]) if parsedargs.skipknown else ()
+        tasks = self.iter_commands(parsedargs.timestamp, parsedargs.command, skip=skip)
+        if parsedargs.bundle <= 1 and not parsedargs.bundledir:
+            for _, path, cmd, _ in tasks:
+                print("cd '{path}'; {cmd}".format(path=path, cmd=cmd), file=outfile)
+            return
+
+        bundles = self.bundle_tasks(list(tasks), max(parsedargs.bundle, 1), parsedargs.cost)
+        if parsedargs.bundledir:
+            os.makedirs(parsedargs.bundledir, exist_ok=True)
+        for i, bundle in enumerate(bundles):
+            lines = ["cd '{path}'; {cmd}".format(path=path, cmd=cmd) for _, path, cmd, _ in bundle]
+            if parsedargs.bundledir:
+                bundlefile = os.path.abspath(os.path.join(parsedargs.bundledir, "bundle_{0}.sh".format(i)))
+                with open(bundlefile, "w") as f:
+                    f.write("\n".join(["#!/usr/bin/env bash"] + ["( {0} )".format(line) for line in lines]) + "\n")
+                print("bash '{0}'".format(bundlefile), file=outfile)
+            else:
+                print("; ".join(["( {0} )".format(line) for line in lines]), file=outfile)
+
+    @staticmethod
+    def bundle_tasks(tasks, bundlesize, costexpr=None):
+        """Splits tasks into ceil(len(tasks) / bundlesize) bundles. Without a cost expression
+    consecutive tasks are grouped together. Otherwise tasks are greedily assigned, most
+    expensive first, to the currently cheapest bundle.
+        """
+        nbundles = -(-len(tasks) // bundlesize)
+        if not costexpr:
+            return [tasks[i * bundlesize:(i + 1) * bundlesize] for i in range(nbundles)]
+
+        import heapq
+        from simunator.templating import environment
+
+        costfunc = environment.compile_expression(costexpr)
+        costs = [float(costfunc(**parammap)) for _, _, _, parammap in tasks]
+
+        heap = [(0.0, i) for i in range(nbundles)]
+        assignments = [[] for _ in range(nbundles)]
+        for taskid in sorted(range(len(tasks)), key=lambda i: -costs[i]):
+            cost, i = heapq.heappop(heap)
+            assignments[i].append(taskid)
+            heapq.heappush(heap, (cost + costs[taskid], i))
+
+        return [[tasks[taskid] for taskid in sorted(taskids)] for taskids in assignments if taskids]
+
+    def run_tasks(self, args):
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Run a command alias for every simulation in a given set.")
+        parser.add_argument("timestamp", type=str, help="Timestamp to process")
+        parser.add_argument(
+            "--command",
+            type=str,
+            help="Command alias to run",
+            dest="command",
+            default="run",
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            dest="jobs",
+            help="Number of simulations to run concurrently. Default is the number of cores",
+            default=os.cpu_count(),
+        )
+        parser.add_argument(
+            "--failed",
+            action="store_true",
+            help="Only rerun simulations whose last run of this command failed",
+        )
+        parser.add_argument(
+            "--skip-known",
+            action="store_true",
+            dest="skipknown",
+            help="Skip simulations whose SIM_HASH occurs in another batch where this command succeeded",
+        )
+        parsedargs = parser.parse_args(args)
+
+        start = time.perf_counter()
+        self.timer = PhaseTimer()
+        self.get_db()
+
+        skip = self.memoized(parsedargs.timestamp, commands=[parsedargs.command]) if parsedargs.skipknown else ()
+        tasks = [task[0:3] for task in self.iter_commands(parsedargs.timestamp, parsedargs.command, skip=skip)]
+        if parsedargs.failed:
+            self.c.execute(
+                "SELECT simrowid FROM simunator_tasks WHERE time == ? AND cmdname == ? AND status != 0;",
+                (parsedargs.timestamp, parsedargs.command),
+            )
+            failed = set(row[0] for row in self.c.fetchall())
+            tasks = [task for task in tasks if task[0] in failed]
+
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from simunator.tasks import run_task
+
+        # Each task is its own subprocess, so threads are enough to keep the workers busy
+        nfailed = 0
+        with ThreadPoolExecutor(max_workers=parsedargs.jobs) as executor:
+            futures = {executor.submit(run_task, cmd, path): (rowid, path) for rowid, path, cmd in tasks}
+            for future in as_completed(futures):
+                rowid, path = futures[future]
+                status, started, finished = future.result()
+                self.timer.add("command " + parsedargs.command, finished - started)
+                if status != 0:
+                    nfailed += 1
+                    print("Failed ({0}): {1}".format(status, path), file=sys.stderr)
+                self.c.execute(
+                    "INSERT OR REPLACE INTO simunator_tasks VALUES ( ?, ?, ?, ?, ?, ?, ? );",
+                    (parsedargs.timestamp, rowid, parsedargs.command, status, finished - started, started, finished),
+                )
+                self.conn.commit()
+
+        self.timer.add("total", time.perf_counter() - start)
+        self.record_stats(parsedargs.timestamp, "run:" + parsedargs.command)
+        print("Ran {0} simulations, {1} failed".format(len(tasks), nfailed))
+
+    def pipeline(self, args):
+        import argparse
+
+        parser = argparse.ArgumentParser(
+            description="Run the commands of every simulation in order and collect each simulation as soon as they "
+            "finish, streaming results into the database.")
+        parser.add_argument("timestamp", type=str, help="Timestamp to process")
+        parser.add_argument(
+            "--commands",
+            type=str,
+            nargs="+",
+            dest="commands",
+            help="Command aliases to chain, in order. Default is every command in configuration order",
+            default=None,
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            dest="jobs",
+            help="Number of simulations to process concurrently. Default is the number of cores",
+            default=os.cpu_count(),
+        )
+        parser.add_argument(
+            "--skip-known",
+            action="store_true",
+            dest="skipknown",
+            help="Skip simulations whose SIM_HASH occurs in another batch where all the commands "
+            "succeeded, copying the values collected there",
+        )
+        parsedargs = parser.parse_args(args)
+        timestamp = parsedargs.timestamp
+
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+        from simunator.arraystore import is_ref
+        from simunator.collectors import load_collector, render_collector
+        from simunator.templating import render
+
+        start = time.perf_counter()
+        self.timer = PhaseTimer()
+        self.add_custom_sqlite_types()
+        self.get_db()
+        self.arraystore = None
+
         self.c.execute("SELECT cmdname, cmdtemplate FROM simunator_commands;")
         cmds = dict(self.c.fetchall())
+        # simunator_commands holds the commands of every configuration, so default to this batch's own
+        self.c.execute("SELECT cmdname FROM simunator_runset_commands WHERE time == ? ORDER BY rowid;", (timestamp, ))
+        own = [row[0] for row in self.c.fetchall() if row[0] in cmds]
+        cmdnames = parsedargs.commands or own or list(cmds)
+        invalid = [cmdname for cmdname in cmdnames if cmdname not in cmds]
+        if invalid:
+            print("Invalid command: {0}".format(", ".join(invalid)), file=sys.stderr)
+            sys.exit(1)
+        self.c.execute("SELECT cmdname, cmdtemplate FROM simunator_collectors;")
+        collectors = {
+            var: load_collector(spec)
+            for var, spec in self.batch_collectors(timestamp, list(dict(self.c.fetchall()).items()))
+        }
 
-        self.c.execute("SELECT * from '{0}';".format(parsedargs.timestamp))
+        skip = self.memoized(timestamp, list(collectors), commands=cmdnames) if parsedargs.skipknown else {}
+        self.c.execute("SELECT *,rowid from '{0}';".format(timestamp))
+        sims = []
+        for paramvals in self.c.fetchall():
+            if paramvals["rowid"] in skip:
+                continue
+            parammap = {**dict(zip(paramvals.keys(), paramvals)), **{"SIM_DATE": timestamp}}
+            path = os.path.join(os.getcwd(), parammap["SIM_PATH"])
+            commands = [(cmdname, render(cmds[cmdname], **parammap)) for cmdname in cmdnames]
+            specs = []
+            for var, spec in collectors.items():
+                spec = render_collector(spec, lambda template: render(template, **parammap))
+                specs.append((var, spec, parammap if isinstance(spec, dict) and "python" in spec else None))
+            sims.append((paramvals["rowid"], path, commands, specs))
+        self.timer.add("prepare", time.perf_counter() - start)
+
+        # Skipped simulations get the values collected for them in other batches, as with collect --skip-known
+        batch = {}
+        for rowid, known in skip.items():
+            for var in collectors:
+                if var in known and not is_ref(known[var]):
+                    batch.setdefault(var, []).append((known[var], rowid, None))
+        n = nfailed = unflushed = 0
+        lastflush = time.time()
+        reportevery = max(1, len(sims) // 10)
+        with ThreadPoolExecutor(max_workers=parsedargs.jobs) as executor:
+            futures = {
+                executor.submit(self.pipeline_sim, path, commands, specs): (rowid, path)
+                for rowid, path, commands, specs in sims
+            }
+            pending = set(futures)
+            while pending:
+                # Wakes up at least every stream_interval, so that finished simulations are committed
+                # even while no other simulation finishes
+                done, pending = wait(pending, timeout=self.stream_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rowid, path = futures[future]
+                    ran, values, errors = future.result()
+                    for cmdname, status, started, finished in ran:
+                        self.timer.add("command " + cmdname, finished - started)
+                        self.c.execute(
+                            "INSERT OR REPLACE INTO simunator_tasks VALUES ( ?, ?, ?, ?, ?, ?, ? );",
+                            (timestamp, rowid, cmdname, status, finished - started, started, finished),
+                        )
+                    if ran and ran[-1][1] != 0:
+                        nfailed += 1
+                        print("Failed ({0}) running {1}: {2}".format(ran[-1][1], ran[-1][0], path), file=sys.stderr)
+                    for error in errors:
+                        print("Failed collecting {0}".format(error), file=sys.stderr)
+                    for var, val, seconds in values:
+                        self.timer.add("collector " + var, seconds)
+                        batch.setdefault(var, []).append((val, rowid, seconds))
+
+                    n += 1
+                    unflushed += 1
+                    if n % reportevery == 0 or n == len(sims):
+                        print("Finished {0}/{1} simulations, {2} failed".format(n, len(sims), nfailed))
+
+                # Committed regularly, so that finished simulations can be queried while others still run
+                if sum(len(updates) for updates in batch.values()) >= self.collect_batch_size or \
+                        unflushed and time.time() - lastflush >= self.stream_interval:
+                    self.flush_collected(timestamp, batch, time.time())
+                    lastflush = time.time()
+                    unflushed = 0
+        self.flush_collected(timestamp, batch, time.time())
+
+        self.timer.add("total", time.perf_counter() - start)
+        self.record_stats(timestamp, "pipeline")
+
+    @staticmethod
+    def pipeline_sim(path, commands, collectors):
+        """Runs the (name, command) pairs in path in order, stopping at the first failure, and then,
+    if all succeeded, the (name, spec, params) collectors. Returns the (name, status, start, end)
+    of every command run, the (name, value, seconds) of every collector and the failed collectors.
+        """
+        from simunator.collectors import timed_collector
+        from simunator.tasks import run_task
+
+        ran = []
+        for cmdname, cmd in commands:
+            status, start, end = run_task(cmd, path)
+            ran.append((cmdname, status, start, end))
+            if status != 0:
+                return ran, [], []
+
+        values, errors = [], []
+        for var, spec, params in collectors:
+            try:
+                values.append((var, ) + timed_collector(spec, path, params))
+            except Exception as e:
+                errors.append("{0} from {1}: {2}".format(var, path, e))
+        return ran, values, errors
+
+    def record_stats(self, timestamp, action):
+        """Stores the phase counts and timings accumulated by self.timer during an action on a batch."""
+        recorded = time.time()
+        self.c.executemany(
+            "INSERT INTO simunator_stats VALUES ( ?, ?, ?, ?, ?, ? );",
+            [(timestamp, action, phase, count, seconds, recorded) for phase, count, seconds in self.timer.rows()],
+        )
+        self.conn.commit()
+
+    def show_stats(self, args):
+        import argparse
+        from simunator.stats import histogram, percentile, latency_buckets, format_bound
+
+        parser = argparse.ArgumentParser(description="Summarize where the time of a simulation batch went.")
+        parser.add_argument("timestamp", type=str, help="Timestamp to process")
+        parser.add_argument(
+            "--top",
+            type=int,
+            dest="top",
+            help="Number of slowest simulations to show",
+            default=10,
+        )
+        parsedargs = parser.parse_args(args)
+        timestamp = parsedargs.timestamp
+
+        self.get_db()
+
+        # Phases of the most recent run of each action. run is recorded per command (e.g. run:analyze),
+        # so running one command does not hide the timings of another
+        self.c.execute(
+            """SELECT action, phase, count, seconds FROM simunator_stats AS s WHERE time == ? AND recorded ==
+               (SELECT max(recorded) FROM simunator_stats WHERE time == s.time AND action == s.action)
+               ORDER BY recorded, rowid;""",
+            (timestamp, ),
+        )
+        rows = self.c.fetchall()
+        if rows:
+            print("{0:<16} {1:<24} {2:>10} {3:>12} {4:>12}".format("action", "phase", "count", "seconds", "mean ms"))
+        for action, phase, count, seconds in rows:
+            print("{0:<16} {1:<24} {2:>10} {3:>12.3f} {4:>12.3f}".format(action, phase, count, seconds,
+                                                                               1e3 * seconds / max(count, 1)))
+
+        self.c.execute(
+            "SELECT name, seconds FROM simunator_timings WHERE time == ? ORDER BY name, seconds;",
+            (timestamp, ),
+        )
+        latencies = {}
+        for name, seconds in self.c.fetchall():
+            latencies.setdefault(name, []).append(seconds)
+        bounds = ["<" + format_bound(bound) for bound in latency_buckets]
+        if latencies:
+            print("\nCollector latencies")
+            print("{0:<16} {1:>8} {2:>10} {3:>10} {4:>10} {5:>10}   {6}".format(
+                "collector", "count", "mean ms", "p50 ms", "p95 ms", "max ms", " ".join(bounds)))
+        for name, ordered in latencies.items():
+            counts = [str(n).rjust(len(bound)) for n, bound in zip(histogram(ordered), bounds)]
+            print("{0:<16} {1:>8} {2:>10.3f} {3:>10.3f} {4:>10.3f} {5:>10.3f}   {6}".format(
+                name, len(ordered), 1e3 * sum(ordered) / len(ordered), 1e3 * percentile(ordered, 50),
+                1e3 * percentile(ordered, 95), 1e3 * ordered[-1], " ".join(counts)))
+
+        self.c.execute(
+            """SELECT SIM_PATH, sum(seconds) AS total FROM simunator_timings JOIN '{0}' ON simrowid == '{0}'.rowid
+               WHERE simunator_timings.time == ? GROUP BY simrowid ORDER BY total DESC LIMIT ?;""".format(timestamp),
+            (timestamp, parsedargs.top),
+        )
+        slowest = self.c.fetchall()
+        if slowest:
+            print("\nSlowest simulations to collect")
+        for path, seconds in slowest:
+            print("{0:>10.3f} s  {1}".format(seconds, path))
+
+        self.c.execute(
+            """SELECT SIM_PATH, cmdname, walltime FROM simunator_tasks JOIN '{0}' ON simrowid == '{0}'.rowid
+               WHERE simunator_tasks.time == ? ORDER BY walltime DESC LIMIT ?;""".format(timestamp),
+            (timestamp, parsedargs.top),
+        )
+        slowest = self.c.fetchall()
+        if slowest:
+            print("\nSlowest simulations to run")
+        for path, cmdname, walltime in slowest:
+            print("{0:>10.3f} s  {1}  {2}".format(walltime, cmdname, path))
+
+    def iter_commands(self, timestamp, cmdname, skip=()):
+        """Yields (rowid, SIM_PATH, rendered command, parameter map) for every simulation in a set,
+    except those whose rowid is in skip.
+        """
+        from simunator.templating import render
+
+        self.c.execute("SELECT cmdname, cmdtemplate FROM simunator_commands;")
+        cmds = dict(self.c.fetchall())
+
+        self.c.execute("SELECT *,rowid from '{0}';".format(timestamp))
 
         for paramvals in self.c.fetchall():
+            if paramvals["rowid"] in skip:
+                continue
             paramlist = paramvals.keys()
             parammap = {
                 **dict(zip(paramlist, paramvals)),
                 **{
-                    "SIM_DATE": parsedargs.timestamp
+                    "SIM_DATE": timestamp
                 },
             }
             path = parammap["SIM_PATH"]
-            cmd = Template(cmds[parsedargs.command]).render(**parammap)
-            print("cd '{path}'; {cmd}".format(path=path, cmd=cmd), file=outfile)
+            yield paramvals["rowid"], path, render(cmds[cmdname], **parammap), parammap
+
+    def tasks(self, runset, command="run"):
+        """Yields (SIM_PATH, rendered command) for every simulation of the runset batch."""
+        self.get_db()
+        for _, path, cmd, _ in self.iter_commands(runset, command):
+            yield path, cmd
+
+    def results(self, runset, columns=None):
+        """Returns the given columns (default all) of the runset batch as a dict of numpy arrays.
+    Array valued results are decoded into object arrays of arrays.
+        """
+        import numpy as np
+        from simunator.arraystore import decode as decode_array
+
+        self.get_db()
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        cursor.execute("SELECT {0} FROM '{1}';".format(
+            ", ".join('"{0}"'.format(column) for column in columns) if columns else "*", runset))
+        names = [description[0] for description in cursor.description]
+        rows = cursor.fetchall()
 
-    def create(self, args):
+        arrayroot = self.array_root()
+        results = {}
+        for name, values in zip(names, zip(*rows) if rows else [()] * len(names)):
+            values = [decode_array(val, arrayroot) for val in values]
+            if any(isinstance(val, np.ndarray) for val in values):
+                column = np.empty(len(values), dtype=object)
+                for i, val in enumerate(values):
+                    column[i] = val
+                results[name] = column
+            else:
+                results[name] = np.array(values)
+        return results
+
+    def create_cmd(self, args):
+        import argparse
         import yaml
 
         parser = argparse.ArgumentParser(description="Generate simulation hiearchy data.")
         parser.add_argument("config", type=str, help="Config file for Simunator.")
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            dest="jobs",
+            help="Number of threads writing simulation directories",
+            default=1,
+        )
+        parser.add_argument(
+            "--dedup",
+            choices=["hardlink", "symlink"],
+            dest="dedup",
+            help="Store one shared copy of templates that render identically for every simulation "
+            "and link it into each simulation directory. Simulations must not modify these files",
+            default=None,
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            dest="dryrun",
+            help="Report what would be created without touching the disk or database",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            dest="chunksize",
+            help="Stream parameter sets, creating and committing this many simulations at a time",
+            default=None,
+        )
+        parser.add_argument(
+            "--append",
+            type=str,
+            dest="append",
+            help="Timestamp of an existing simulation batch to add the simulations to, "
+            "e.g. to extend a Sobol or Halton design using 'skip'",
+            default=None,
+        )
+        parser.add_argument(
+            "--reuse",
+            choices=["link", "copy"],
+            dest="reuse",
+            help="Symlink or copy the directory of a simulation with the same SIM_HASH in another batch, outputs "
+            "included, instead of writing a fresh one. Linked simulations are copied when their source is deleted",
+            default=None,
+        )
         parsedargs = parser.parse_args(args)
 
         with open(parsedargs.config) as f:
-            self.inputconfig = yaml.load(f, Loader=yaml.FullLoader)
+            config = yaml.load(f, Loader=yaml.FullLoader)
 
-        self.currtime = time.strftime("%s", time.gmtime())
+        try:
+            self.create(
+                config,
+                jobs=parsedargs.jobs,
+                dedup=parsedargs.dedup,
+                chunksize=parsedargs.chunksize,
+                append=parsedargs.append,
+                dry_run=parsedargs.dryrun,
+                reuse=parsedargs.reuse,
+            )
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
 
-        self.gen_param_sets()
+    def create(self, config, jobs=1, dedup=None, chunksize=None, append=None, dry_run=False, reuse=None):
+        """Creates a simulation batch from config, the parsed yaml configuration (see example.yaml),
+    and returns its timestamp. Template files are read relative to the working directory.
+        """
+        start = time.perf_counter()
+        self.timer = PhaseTimer()
+        self.inputconfig = config
+        with self.timer.phase("params"):
+            self.gen_param_sets(chunksize=chunksize)
         self.gen_template_strings()
 
+        if dry_run:
+            self.report_dry_run(dedup)
+            return None
+
         self.get_db()
-        self.add_set_to_db()
-        self.create_sims()
+        if append:
+            self.c.execute("SELECT time FROM simunator_runsets WHERE time == ?;", (append, ))
+            if not self.c.fetchall():
+                raise ValueError("Invalid timestamp: {0}".format(append))
+            self.currtime = append
+        else:
+            self.currtime = self.new_timestamp()
+
+        # Parameter sets are generated lazily, so invalid distributions only raise here. The batch's
+        # uncommitted rows must not be committed by a later call on the shared connection
+        try:
+            self.add_set_to_db(append=bool(append))
+            self.create_sims(jobs=jobs, dedup=dedup, reuse=reuse)
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.timer.add("total", time.perf_counter() - start)
+        self.record_stats(self.currtime, "create")
+        return self.currtime
+
+    def new_timestamp(self):
+        """Returns the current time as a batch timestamp, bumped past any batch already using it."""
+        timestamp = time.strftime("%s", time.gmtime())
+        # Batches still being deleted keep their table until the delete completes
+        self.c.execute("SELECT time FROM simunator_runsets UNION SELECT time FROM simunator_trash;")
+        existing = set(row[0] for row in self.c.fetchall())
+        while timestamp in existing:
+            timestamp = str(int(timestamp) + 1)
+        return timestamp
 
     def modify(self, args):
+        import argparse
         import yaml
 
         parser = argparse.ArgumentParser(description="Replace simulation 'system' configuration, excluding pathstring.")
@@ -173,7 +849,199 @@ class Simunator:
         self.c.execute("DELETE FROM simunator_collectors;")
         self.add_collectors()
 
-    def collect(self, args):
+    def refine(self, args):
+        import argparse
+
+        parser = argparse.ArgumentParser(
+            description="Create a new simulation batch, linked to an existing one, with simulations placed "
+            "where a collected value changes the most.")
+        parser.add_argument("timestamp", type=str, help="Timestamp to refine")
+        parser.add_argument("collector", type=str, help="Collected value to refine on")
+        parser.add_argument(
+            "--samples",
+            type=int,
+            dest="samples",
+            help="Number of new simulations. Default is 10%% of the existing batch",
+            default=None,
+        )
+        parser.add_argument(
+            "--neighbors",
+            type=int,
+            dest="neighbors",
+            help="Number of neighbors each simulation is compared to. Default is twice the number of parameters",
+            default=None,
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            dest="jobs",
+            help="Number of threads writing simulation directories",
+            default=1,
+        )
+        parsedargs = parser.parse_args(args)
+
+        import ast
+        import numpy as np
+        from simunator.collectors import load_collector
+        from simunator.refine import refine_points
+
+        self.get_db()
+
+        self.c.execute(
+            "SELECT pathstring, templatestr FROM simunator_runsets WHERE time == ?;",
+            (parsedargs.timestamp, ),
+        )
+        runset = self.c.fetchone()
+        if runset is None:
+            print("Invalid timestamp: {0}".format(parsedargs.timestamp), file=sys.stderr)
+            sys.exit(1)
+
+        self.c.execute("SELECT cmdname, cmdtemplate FROM simunator_collectors;")
+        collectors = {cmdname: load_collector(cmdtemplate) for cmdname, cmdtemplate in self.c.fetchall()}
+
+        columns = self.table_columns(parsedargs.timestamp)
+        self.c.execute("SELECT * from '{0}';".format(parsedargs.timestamp))
+        sims = self.c.fetchall()
+        if parsedargs.collector not in columns:
+            print("Invalid collector: {0}".format(parsedargs.collector), file=sys.stderr)
+            sys.exit(1)
+
+        # Only simulations with a collected scalar take part, and non-numeric parameters are carried
+        # over from the simulation each new point is split off from
+        params = [key for key in columns if key[0:4] != "SIM_" and key not in collectors]
+        sims = [sim for sim in sims if isinstance(sim[parsedargs.collector], (int, float))]
+        if not sims:
+            print("Nothing to refine: no simulation has a numeric {0}".format(parsedargs.collector), file=sys.stderr)
+            return
+        numeric = [param for param in params if all(isinstance(sim[param], (int, float)) for sim in sims)]
+        if not numeric:
+            print("Nothing to refine: the batch has no numeric parameters", file=sys.stderr)
+            return
+
+        newpoints, parents = refine_points(
+            np.reshape([[sim[param] for param in numeric] for sim in sims], (-1, len(numeric))),
+            [sim[parsedargs.collector] for sim in sims],
+            parsedargs.samples or max(1, len(sims) // 10),
+            parsedargs.neighbors or 2 * len(numeric),
+        )
+        if not len(newpoints):
+            print("Nothing to refine", file=sys.stderr)
+            sys.exit(1)
+
+        newparams = {
+            param: newpoints[:, numeric.index(param)].tolist()
+            if param in numeric else [sims[parent][param] for parent in parents]
+            for param in params
+        }
+
+        self.inputconfig = {
+            "dists": [{
+                "Points": {
+                    "params": newparams
+                }
+            }],
+            "system": {
+                "pathstring": runset["pathstring"],
+                "collectors": collectors,
+            },
+        }
+        self.templatestrs = ast.literal_eval(runset["templatestr"])
+
+        self.currtime = self.new_timestamp()
+        self.gen_param_sets()
+        self.add_runsets()
+        self.add_set_to_db(append=True)
+        self.c.execute("INSERT INTO simunator_links VALUES ( ?, ? );", (self.currtime, parsedargs.timestamp))
+        self.c.execute(
+            "INSERT INTO simunator_runset_commands SELECT ?, cmdname FROM simunator_runset_commands WHERE time == ?;",
+            (self.currtime, parsedargs.timestamp),
+        )
+        self.create_sims(jobs=parsedargs.jobs)
+        self.record_stats(self.currtime, "refine")
+
+        print("Created simulation batch {0} refining {1}".format(self.currtime, parsedargs.timestamp))
+
+    def export_runsets(self, args):
+        import argparse
+
+        parser = argparse.ArgumentParser(
+            description="Export simulation batches to a columnar dataset partitioned by batch. "
+            "Load it back with simunator.export.load(path, columns=..., filters=...).")
+        parser.add_argument("path", type=str, help="Output dataset directory")
+        parser.add_argument("timestamps", type=str, nargs="*", help="Timestamps to export. Default is all")
+        parser.add_argument(
+            "--format",
+            choices=["parquet", "ipc"],
+            dest="format",
+            help="Parquet or Arrow IPC files",
+            default="parquet",
+        )
+        parsedargs = parser.parse_args(args)
+
+        from simunator.export import export
+
+        self.get_db()
+
+        timestamps = parsedargs.timestamps
+        if not timestamps:
+            self.c.execute("SELECT time FROM simunator_runsets;")
+            timestamps = [row[0] for row in self.c.fetchall()]
+
+        export(self.conn, timestamps, parsedargs.path, parsedargs.format, self.array_root())
+        print("Exported {0} simulation batches to {1}".format(len(timestamps), parsedargs.path))
+
+    def migrate(self, args):
+        """Copies every simulation batch into the normalized tables
+        simunator_sims (runset, sim, path)
+        simunator_params (runset, sim, name, value)
+        simunator_results (runset, sim, name, value)
+    where sim is the rowid in the batch's own table, and keeps them up to date from then on.
+    Queries across batches become single indexed SELECTs, e.g.
+        SELECT runset, sim, simunator_results.value FROM simunator_results JOIN simunator_params USING (runset, sim)
+        WHERE simunator_params.name == 'x' AND simunator_params.value == 0.5 AND simunator_results.name == 'z';
+        """
+        import argparse
+
+        parser = argparse.ArgumentParser(
+            description="Migrate all simulation batches into the normalized sims/params/results tables.")
+        parser.parse_args(args)
+
+        self.get_db()
+
+        self.c.execute("SELECT time FROM simunator_runsets;")
+        for timestamp in [row[0] for row in self.c.fetchall()]:
+            self.sync_long(timestamp)
+            print("Migrated {0}".format(timestamp))
+
+        self.c.execute("INSERT OR REPLACE INTO simunator_settings VALUES ( 'schema', 'long' );")
+        self.long_schema = True
+
+    def sync_long(self, timestamp, since=0):
+        """Copies the simulations of a batch with rowid > since into the normalized tables."""
+        self.c.execute("SELECT cmdname FROM simunator_collectors;")
+        collectors = set(row[0] for row in self.c.fetchall())
+        self.c.execute("PRAGMA table_info('{0}');".format(timestamp))
+        columns = [row["name"] for row in self.c.fetchall()]
+
+        self.c.execute(
+            "INSERT OR REPLACE INTO simunator_sims SELECT ?, rowid, SIM_PATH FROM '{0}' WHERE rowid > ?;".format(
+                timestamp),
+            (timestamp, since),
+        )
+        for column in columns:
+            if column[0:4] == "SIM_":
+                continue
+            self.c.execute(
+                """INSERT OR REPLACE INTO {0} SELECT ?, rowid, ?, "{1}" FROM '{2}'
+                   WHERE rowid > ? AND "{1}" IS NOT NULL;""".format(
+                    "simunator_results" if column in collectors else "simunator_params", column, timestamp),
+                (timestamp, column, since),
+            )
+
+    def collect_cmd(self, args):
+        import argparse
+        from simunator.arraystore import default_threshold
+
         parser = argparse.ArgumentParser(description="Collect simulation batch.")
         parser.add_argument("timestamp", type=str, help="Timestamp to process")
         parser.add_argument(
@@ -183,59 +1051,258 @@ class Simunator:
             help="Collector to use. Default is to collect all",
             default=None,
         )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            dest="jobs",
+            help="Number of collector processes to run concurrently",
+            default=1,
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only collect values that are missing or whose sim outputs changed since last collection",
+        )
+        parser.add_argument(
+            "--array-store",
+            choices=["db", "npy", "hdf5"],
+            dest="arraystore",
+            help="Where to keep large array results. 'npy' and 'hdf5' store them under {0} next to the database "
+            "and keep only a reference in it".format(self.array_dir),
+            default="db",
+        )
+        parser.add_argument(
+            "--array-threshold",
+            type=int,
+            dest="arraythreshold",
+            help="Size in bytes from which array results go to the array store. Default is {0}".format(
+                default_threshold),
+            default=None,
+        )
+        parser.add_argument(
+            "--skip-known",
+            action="store_true",
+            dest="skipknown",
+            help="Copy values already collected for simulations with the same SIM_HASH in other batches "
+            "instead of running their collectors",
+        )
         parsedargs = parser.parse_args(args)
 
-        self.get_db()
+        self.collect(
+            parsedargs.timestamp,
+            collector=parsedargs.collector,
+            jobs=parsedargs.jobs,
+            incremental=parsedargs.incremental,
+            arraystore=parsedargs.arraystore,
+            arraythreshold=parsedargs.arraythreshold,
+            skip_known=parsedargs.skipknown,
+        )
 
-        self.c.execute("SELECT *,rowid from '{0}';".format(parsedargs.timestamp))
-        sims = self.c.fetchall()
-        paramlist = sims[0].keys()
+    def collect(self, runset, collector=None, jobs=1, incremental=False, arraystore="db", arraythreshold=None,
+                skip_known=False):
+        """Runs the collectors (or only the named one) on every simulation of the runset batch and
+    stores the results. See collect_cmd for the options. Returns the number of values collected.
+        """
+        from simunator.arraystore import default_threshold, is_ref, stores
+        from simunator.collectors import try_collector, load_collector, render_collector
+        from simunator.templating import render
 
-        if parsedargs.collector:
+        start = time.perf_counter()
+        self.timer = PhaseTimer()
+        self.add_custom_sqlite_types()
+        self.get_db()
+        collecttime = time.time()
+
+        if collector:
             self.c.execute(
                 "SELECT cmdname, cmdtemplate FROM simunator_collectors WHERE cmdname == ?;",
-                (parsedargs.collector, ),
+                (collector, ),
             )
             cmdpairs = self.c.fetchall()
         else:
             self.c.execute("SELECT cmdname, cmdtemplate FROM simunator_collectors;")
             cmdpairs = self.c.fetchall()
+        # Every create adds its collectors again, so only the latest definition of each name is used
+        cmdpairs = self.batch_collectors(runset, list(dict(cmdpairs).items()))
+        if collector and not cmdpairs:
+            print("Invalid collector: {0}".format(collector), file=sys.stderr)
+            return 0
 
-        import subprocess
-        import io
+        self.c.execute("SELECT *,rowid from '{0}';".format(runset))
+        sims = self.c.fetchall()
+        paramlist = sims[0].keys()
 
+        if incremental:
+            self.c.execute(
+                "SELECT simrowid, cmdname, collected FROM simunator_collections WHERE time == ?;",
+                (runset, ),
+            )
+            collected = {(row[0], row[1]): row[2] for row in self.c.fetchall()}
+
+        # Copied values are stored without timings. Array store references are not copied, since they
+        # point into the other batch's files
+        memo = self.memoized(runset, columns=[cmdpair[0] for cmdpair in cmdpairs]) if skip_known else {}
+        copied = {}
+
+        tasks = []
         for paramvals in sims:
             parammap = {
                 **dict(zip(paramlist, paramvals)),
                 **{
-                    "SIM_DATE": parsedargs.timestamp
+                    "SIM_DATE": runset
                 },
             }
             path = os.path.join(os.getcwd(), parammap["SIM_PATH"])
+            lastmodified = None
             for cmdpair in cmdpairs:
-                var, cmdtemplate = cmdpair
-                cmd = Template(cmdtemplate).render(**parammap)
-                result = subprocess.run(cmd, cwd=path, stdout=subprocess.PIPE, shell=True)
+                var, spec = cmdpair[0], load_collector(cmdpair[1])
+                known = memo.get(paramvals["rowid"], {})
+                if var in known and not is_ref(known[var]):
+                    copied.setdefault(var, []).append((known[var], paramvals["rowid"], None))
+                    continue
+                if incremental and parammap[var] is not None:
+                    lastcollected = collected.get((paramvals["rowid"], var))
+                    if lastcollected is not None:
+                        if lastmodified is None:
+                            lastmodified = self.last_modified(path)
+                        if lastmodified <= lastcollected:
+                            continue
+
+                spec = render_collector(spec, lambda template: render(template, **parammap))
+                params = parammap if isinstance(spec, dict) and "python" in spec else None
+                tasks.append((paramvals["rowid"], var, spec, path, params))
+
+        self.timer.add("prepare", time.perf_counter() - start)
+
+        self.arraystore = None
+        if arraystore != "db":
+            self.arraystore = stores[arraystore](self.array_root())
+            self.arraythreshold = default_threshold if arraythreshold is None else arraythreshold
+
+        if copied:
+            self.timer.add("copied", 0.0, count=sum(len(values) for values in copied.values()))
+            self.flush_collected(runset, copied, collecttime)
+
+        specs = [task[2] for task in tasks]
+        paths = [task[3] for task in tasks]
+        params = [task[4] for task in tasks]
+        if jobs > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                chunksize = max(1, len(tasks) // (4 * jobs))
+                results = executor.map(try_collector, specs, paths, params, chunksize=chunksize)
+                self.store_collected(runset, tasks, results, collecttime)
+        else:
+            self.store_collected(runset, tasks, map(try_collector, specs, paths, params), collecttime)
+
+        if self.arraystore:
+            self.arraystore.close()
+
+        self.timer.add("total", time.perf_counter() - start)
+        self.record_stats(runset, "collect")
+        return len(tasks)
+
+    def batch_collectors(self, timestamp, cmdpairs):
+        """Returns the (name, spec) collector pairs to store in a batch. simunator_collectors holds the
+    collectors of every configuration, so only those the batch's table has a column for are used.
+    With the long schema, the table first gets a column for every collector it lacks (e.g. one
+    added with modify), so that new collectors need no manual schema change.
+        """
+        from simunator.collectors import load_collector
+
+        columns = self.table_columns(timestamp)
+        if not self.long_schema:
+            return [cmdpair for cmdpair in cmdpairs if cmdpair[0] in columns]
+
+        for var, cmdtemplate in cmdpairs:
+            if var not in columns:
+                spec = load_collector(cmdtemplate)
+                collectortype = spec.get("type", "NUMERIC").upper() if isinstance(spec, dict) else "NUMERIC"
+                self.c.execute("ALTER TABLE '{0}' ADD COLUMN {1} {2};".format(timestamp, var, collectortype))
+        return cmdpairs
+
+    @staticmethod
+    def last_modified(path):
+        """Returns the newest modification time of the files directly inside path."""
+        try:
+            return max((entry.stat().st_mtime for entry in os.scandir(path) if entry.is_file()), default=0.0)
+        except OSError:
+            return 0.0
+
+    def store_collected(self, timestamp, tasks, results, collecttime):
+        """Writes collector results back to the runset table as they arrive, committing every
+    collect_batch_size values so that large collections are not held in one transaction.
+    results yields (value, seconds, error) triples, and the seconds are recorded in
+    simunator_timings. Failed collectors are reported and store NULL, without stopping the others.
+        """
+        import numpy as np
+
+        batch = {}
+        for n, (task, (val, seconds, error)) in enumerate(zip(tasks, results), 1):
+            rowid, var = task[0:2]
+            if error is not None:
+                print("Failed collecting {0} from {1}: {2}".format(var, task[3], error), file=sys.stderr)
+            else:
+                self.timer.add("collector " + var, seconds)
+            if self.arraystore and isinstance(val, np.ndarray) and val.nbytes >= self.arraythreshold:
+                with self.timer.phase("arraystore"):
+                    val = self.arraystore.put(timestamp, var, rowid, val)
+            batch.setdefault(var, []).append((val, rowid, seconds))
+            if n % self.collect_batch_size == 0:
+                self.flush_collected(timestamp, batch, collecttime)
+        self.flush_collected(timestamp, batch, collecttime)
+
+    def flush_collected(self, timestamp, batch, collecttime):
+        start = time.perf_counter()
+        for var, updates in batch.items():
+            exectemplate = "UPDATE '{0}' SET '{1}' = ? where rowid == ?;".format(timestamp, var)
+            self.c.executemany(exectemplate, [(val, rowid) for val, rowid, _ in updates])
+            self.c.executemany(
+                "INSERT OR REPLACE INTO simunator_collections VALUES ( ?, ?, ?, ? );",
+                [(timestamp, rowid, var, collecttime) for _, rowid, _ in updates],
+            )
+            self.c.executemany(
+                "INSERT OR REPLACE INTO simunator_timings VALUES ( ?, ?, ?, ? );",
+                [(timestamp, rowid, var, seconds) for _, rowid, seconds in updates if seconds is not None],
+            )
+            if self.long_schema:
+                self.c.executemany(
+                    "INSERT OR REPLACE INTO simunator_results VALUES ( ?, ?, ?, ? );",
+                    [(timestamp, rowid, var, val) for val, rowid, _ in updates],
+                )
+        batch.clear()
+        # Arrays must be on disk before the references to them are committed
+        if self.arraystore:
+            self.arraystore.flush()
+        self.conn.commit()
+        self.timer.add("db", time.perf_counter() - start)
 
-                val = np.loadtxt(io.StringIO(result.stdout.decode("utf-8")), delimiter=" ")
+    def load_array(self, ref):
+        """Returns the array behind a collected value: memory-mapped for npy and read from file for
+    hdf5 values kept in the array store, and the value itself otherwise.
+        """
+        from simunator.arraystore import load as load_array
 
-                # FIXME: The type of the column should set this, not the parsed result
-                val = float(val) if val.size == 1 else val
+        return load_array(ref, self.array_root())
 
-                exectemplate = "UPDATE '{0}' SET '{1}' = ? where rowid == ?;".format(parsedargs.timestamp, var)
-                self.c.execute(exectemplate, (
-                    val,
-                    paramvals["rowid"],
-                ))
+    def array_root(self):
+        """Directory of the array store, which lives next to the database."""
+        return os.path.join(os.path.dirname(os.path.abspath(self.db)), self.array_dir)
 
-    def gen_param_sets(self):
+    def gen_param_sets(self, chunksize=None):
         """Creates a parammaker object that generates all unique combinations of
-    parameters as specified by input yaml file, and a psets list, the actualization
-    of the generators into a list.
+    parameters as specified by input yaml file. The nsims parameter sets are exposed
+    through pset_chunks, an iterator over lists of at most chunksize tuples (a single
+    list of all of them if chunksize is None).
         """
+        from simunator.parammaker import ParamMaker
+
         pmaker = ParamMaker()
         pmaker.from_param_makers(*[ParamMaker(dist) for dist in self.inputconfig["dists"]])
-        self.params, self.psets = pmaker.actualize()
+        self.params = pmaker.param_names()
+        self.nsims = pmaker.size()
+        self.pset_chunks = (psets.tolist() for psets in pmaker.iter_arrays(chunksize))
 
     def gen_template_strings(self):
         """Generates template strings database from list of input templates."""
@@ -246,10 +1313,13 @@ class Simunator:
 
     def get_db(self):
         """Opens or creates sqlite3 database that contains simulation information for
-    faithful reproduction of simulation run information.
+    faithful reproduction of simulation run information. The connection is opened once and
+    shared by every action on this object.
         """
-        self.conn = sqlite3.connect(self.db)
-        self.conn.row_factory = sqlite3.Row
+        if getattr(self, "conn", None) is not None:
+            return
+
+        self.conn = connect(self.db, self.journal_mode)
         self.c = self.conn.cursor()
         self.c.execute("""CREATE TABLE IF NOT EXISTS simunator_runsets (
                             time TEXT, pathstring TEXT, templatestr TEXT
@@ -260,6 +1330,48 @@ class Simunator:
         self.c.execute("""CREATE TABLE IF NOT EXISTS simunator_collectors (
                             cmdname TEXT, cmdtemplate TEXT
                      );""")
+        self.c.execute("""CREATE TABLE IF NOT EXISTS simunator_collections (
+                            time TEXT, simrowid INTEGER, cmdname TEXT, collected REAL,
+                            PRIMARY KEY (time, simrowid, cmdname)
+                     );""")
+        self.c.execute("""CREATE TABLE IF NOT EXISTS simunator_settings (
+                            key TEXT PRIMARY KEY, value TEXT
+                     );""")
+        self.c.execute("""CREATE TABLE IF NOT EXISTS simunator_sims (
+                            runset TEXT, sim INTEGER, path TEXT,
+                            PRIMARY KEY (runset, sim)
+                     );""")
+        for table in ("simunator_params", "simunator_results"):
+            self.c.execute("""CREATE TABLE IF NOT EXISTS {0} (
+                                runset TEXT, sim INTEGER, name TEXT, value,
+                                PRIMARY KEY (runset, sim, name)
+                         );""".format(table))
+            self.c.execute("CREATE INDEX IF NOT EXISTS {0}_value ON {0} ( name, value );".format(table))
+        self.c.execute("""CREATE TABLE IF NOT EXISTS simunator_runset_commands (
+                            time TEXT, cmdname TEXT
+                     );""")
+        self.c.execute("""CREATE TABLE IF NOT EXISTS simunator_links (
+                            time TEXT, parent TEXT
+                     );""")
+        self.c.execute("""CREATE TABLE IF NOT EXISTS simunator_stats (
+                            time TEXT, action TEXT, phase TEXT, count INTEGER, seconds REAL, recorded REAL
+                     );""")
+        self.c.execute("""CREATE TABLE IF NOT EXISTS simunator_timings (
+                            time TEXT, simrowid INTEGER, name TEXT, seconds REAL,
+                            PRIMARY KEY (time, simrowid, name)
+                     );""")
+        self.c.execute("""CREATE TABLE IF NOT EXISTS simunator_trash (
+                            time TEXT PRIMARY KEY, deleted REAL
+                     );""")
+        self.c.execute("""CREATE TABLE IF NOT EXISTS simunator_tasks (
+                            time TEXT, simrowid INTEGER, cmdname TEXT, status INTEGER,
+                            walltime REAL, started REAL, finished REAL,
+                            PRIMARY KEY (time, simrowid, cmdname)
+                     );""")
+
+        self.c.execute("SELECT value FROM simunator_settings WHERE key == 'schema';")
+        row = self.c.fetchone()
+        self.long_schema = row is not None and row[0] == "long"
 
     def add_runsets(self):
         self.c.execute(
@@ -279,67 +1391,294 @@ class Simunator:
             )
 
     def add_collectors(self):
+        from simunator.collectors import dump_collector
+
         for collectname, collect_template in self.inputconfig["system"]["collectors"].items():
             self.c.execute(
                 "INSERT INTO simunator_collectors VALUES ( ?, ? );",
-                (collectname, collect_template),
+                (collectname, dump_collector(collect_template)),
             )
 
-    def add_set_to_db(self):
+    def add_set_to_db(self, append=False):
         """Adds system information for current simulation set to database and create
-    table that holds the unique combinations of param:value pairs.
+    table that holds the unique combinations of param:value pairs. When appending to an
+    existing set, only the table is (re)used.
         """
-        self.add_runsets()
-        self.add_commands()
-        self.add_collectors()
+        if not append:
+            self.add_runsets()
+            self.add_commands()
+            self.add_collectors()
+            self.c.executemany(
+                "INSERT INTO simunator_runset_commands VALUES ( ?, ? );",
+                [(self.currtime, cmdname) for cmdname in self.inputconfig["system"]["commands"]],
+            )
+
+        firstchunk = next(self.pset_chunks)
+        self.pset_chunks = it.chain([firstchunk], self.pset_chunks)
 
-        paramstr = "SIM_PATH STRING"
-        for param, valexample in zip(self.params, self.psets[0]):
+        paramstr = "SIM_PATH STRING, SIM_HASH STRING"
+        for param, valexample in zip(self.params, firstchunk[0]):
             paramstr += (", " + param + " STRING" if isinstance(valexample, str) else ", " + param + " NUMERIC")
 
         collectors = self.inputconfig["system"]["collectors"]
-        for collector in collectors.keys():
-            collectortype = collectors.get("type", "NUMERIC").upper()
+        for collector, spec in collectors.items():
+            collectortype = spec.get("type", "NUMERIC").upper() if isinstance(spec, dict) else "NUMERIC"
             paramstr += ", " + collector + " " + collectortype
 
         self.c.execute("CREATE TABLE IF NOT EXISTS '{0}' ( {1} );".format(
             str(self.currtime),
             paramstr,
         ))
+        # Batches created before SIM_HASH existed get the column when appended to
+        if "SIM_HASH" not in self.table_columns(self.currtime):
+            self.c.execute("ALTER TABLE '{0}' ADD COLUMN SIM_HASH STRING;".format(self.currtime))
+
+    def table_columns(self, table):
+        self.c.execute("PRAGMA table_info('{0}');".format(table))
+        return [row["name"] for row in self.c.fetchall()]
+
+    def known_paths(self):
+        """Returns {SIM_HASH: SIM_PATH} over every other live batch, the most recent batch winning."""
+        known = {}
+        self.c.execute("SELECT time FROM simunator_runsets WHERE time != ? ORDER BY time;", (self.currtime, ))
+        for other in [row[0] for row in self.c.fetchall()]:
+            if "SIM_HASH" in self.table_columns(other):
+                self.c.execute("SELECT SIM_HASH, SIM_PATH FROM '{0}' WHERE SIM_HASH IS NOT NULL;".format(other))
+                known.update((row[0], row[1]) for row in self.c.fetchall())
+        return known
+
+    def memoized(self, timestamp, columns=(), commands=()):
+        """Returns {rowid: {column: value}} for the simulations of a batch whose SIM_HASH occurs in
+    another live batch, with SIM_PATH and the collected (non-null) values of the given columns of
+    the matching simulation (from the most recent batch holding a value). With commands, only
+    simulations that ran each of these commands successfully count, so that identical batches
+    that never ran do not skip each other.
+        """
+        memo = {}
+        if "SIM_HASH" not in self.table_columns(timestamp):
+            return memo
+
+        self.c.execute("SELECT time FROM simunator_runsets WHERE time != ? ORDER BY time;", (timestamp, ))
+        for other in [row[0] for row in self.c.fetchall()]:
+            othercolumns = self.table_columns(other)
+            if "SIM_HASH" not in othercolumns:
+                continue
+            shared = [column for column in columns if column in othercolumns]
+            names = {"other": other}
+            values = []
+            for i, column in enumerate(shared):
+                names["column{0}".format(i)] = column
+                values.append("""CASE WHEN EXISTS (SELECT 1 FROM simunator_collections WHERE time == :other
+                                 AND simrowid == o.rowid AND cmdname == :column{0}) THEN o."{1}" END""".format(
+                    i, column))
+            succeeded = ["1"]
+            for i, cmdname in enumerate(commands):
+                names["command{0}".format(i)] = cmdname
+                succeeded.append("""EXISTS (SELECT 1 FROM simunator_tasks WHERE time == :other AND simrowid == o.rowid
+                                    AND cmdname == :command{0} AND status == 0)""".format(i))
+            self.c.execute(
+                "SELECT n.rowid, {0} FROM '{1}' AS n JOIN '{2}' AS o ON n.SIM_HASH == o.SIM_HASH WHERE {3};".format(
+                    ", ".join(["o.SIM_PATH"] + values), timestamp, other, " AND ".join(succeeded)),
+                names,
+            )
+            for row in self.c.fetchall():
+                values = memo.setdefault(row[0], {})
+                values["SIM_PATH"] = row[1]
+                values.update((column, val) for column, val in zip(shared, row[2:]) if val is not None)
+        return memo
+
+    def static_templates(self):
+        """Returns the names of templates whose rendered output does not depend on any
+    per-simulation variable, and so is identical across the whole runset.
+        """
+        from jinja2 import meta
+        from simunator.templating import environment
+
+        simvars = set(self.params) | {"SIM_PATH"}
+        return [
+            fname for fname, templatestr in self.templatestrs.items()
+            if not meta.find_undeclared_variables(environment.parse(templatestr)) & simvars
+        ]
+
+    def report_dry_run(self, dedup):
+        from simunator.templating import render
+
+        nsims = self.nsims
+        static = self.static_templates()
+        nbytes = sum(nsims * len(render(self.templatestrs[fname]).encode()) for fname in static)
+        for psets in self.pset_chunks:
+            for pset in psets:
+                paramdict = dict(zip(self.params, pset))
+                nbytes += sum(
+                    len(render(templatestr, **paramdict).encode()) for fname, templatestr in self.templatestrs.items()
+                    if fname not in static)
+        print("Would create {0} simulations, {1} files, {2} bytes".format(
+            nsims, nsims * len(self.templatestrs), nbytes))
+
+        savedbytes = sum(len(render(self.templatestrs[fname]).encode()) * (nsims - 1) for fname in static)
+        # Hardlinks share the stored inode, while every symlink needs an inode of its own
+        savedinodes = len(static) * (nsims - 1) if dedup != "symlink" else -len(static)
+        print("{0} template(s) identical across simulations: {1}".format(len(static), ", ".join(static)))
+        print("{0} {1} would save {2} bytes and {3} inodes".format(
+            "Deduplicating with" if dedup else "--dedup", dedup or "hardlink", savedbytes, savedinodes))
+
+    def create_sims(self, jobs=1, dedup=None, reuse=None):
+        """Write simulation information to disk for actual running. Simulation directories are
+    written from a pool of jobs threads, since this is dominated by filesystem latency.
+    With reuse ("link" or "copy"), simulations whose SIM_HASH occurs in another batch get
+    that simulation's directory instead.
+        """
+        import hashlib
+        import json
+        from simunator.templating import render
 
-    def create_sims(self):
-        """Write simulation information to disk for actual running."""
         currpath = os.getcwd()
         sim_keywords = {"SIM_DATE": self.currtime}
-        for pset in self.psets:
-            paramdict = dict(zip(self.params, pset))
-
-            paramdict["SIM_PATH"] = os.path.join(
-                currpath,
-                Template(self.inputconfig["system"]["pathstring"]).render(**{
-                    **sim_keywords,
-                    **paramdict
-                }),
-            )
-            print("Creating path: {0}".format(paramdict["SIM_PATH"]))
-            try:
-                os.makedirs(paramdict["SIM_PATH"])
-            except:
-                pass
 
-            for fname, templatestr in self.templatestrs.items():
-                ofile = os.path.join(paramdict["SIM_PATH"], fname)
-                tm = Template(templatestr)
+        self.c.execute("SELECT cmdname, cmdtemplate FROM simunator_commands;")
+        self.commandkey = json.dumps(sorted(dict(self.c.fetchall()).items())).encode()
+        self.reuse = reuse
+        self.knownpaths = self.known_paths() if reuse else {}
+
+        self.dedup = dedup
+        self.sharedfiles = {}
+        if dedup:
+            shareddir = os.path.join(currpath, self.shared_dir, str(self.currtime))
+            os.makedirs(shareddir, exist_ok=True)
+            for fname in self.static_templates():
+                content = render(self.templatestrs[fname])
+                sharedfile = os.path.join(shareddir, hashlib.sha256(content.encode()).hexdigest())
+                if not os.path.exists(sharedfile):
+                    with open(sharedfile, "w") as f:
+                        f.write(content)
+                self.sharedfiles[fname] = sharedfile
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.c.execute("SELECT max(rowid) FROM '{0}';".format(self.currtime))
+        lastrowid = self.c.fetchone()[0] or 0
 
-                print("Creating file: " + ofile)
+        ncreated = 0
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            mapper = executor.map if jobs > 1 else map
+            for psets in self.pset_chunks:
+                paramdicts = []
+                with self.timer.phase("paths"):
+                    for pset in psets:
+                        paramdict = dict(zip(self.params, pset))
+
+                        paramdict["SIM_PATH"] = os.path.join(
+                            currpath,
+                            render(self.inputconfig["system"]["pathstring"], **{
+                                **sim_keywords,
+                                **paramdict
+                            }),
+                        )
+                        paramdicts.append(paramdict)
+
+                with self.timer.phase("sims"):
+                    ncreated = self.report_progress(mapper(self.write_sim, paramdicts), ncreated)
+
+                if paramdicts:
+                    start = time.perf_counter()
+                    self.c.executemany(
+                        "INSERT INTO '{0}' ( {1} ) VALUES ( {2} );".format(
+                            self.currtime,
+                            ", ".join(paramdicts[0].keys()),
+                            ("?, " * len(paramdicts[0])).rstrip(", "),
+                        ),
+                        [tuple(paramdict.values()) for paramdict in paramdicts],
+                    )
+                    self.conn.commit()
+                    self.timer.add("db", time.perf_counter() - start)
+
+        # Indexed after inserting, which is much cheaper than maintaining the indexes during the inserts
+        with self.timer.phase("index"):
+            index_columns(self.c, self.currtime, self.params + ["SIM_HASH"])
+
+            if self.long_schema:
+                self.sync_long(self.currtime, since=lastrowid)
+
+    def write_sim(self, paramdict):
+        """Creates a single simulation directory and renders every template into it. Rendering and
+    file system time are accumulated in the render and files phases.
+
+    Also sets paramdict["SIM_HASH"], a sha256 of the parameter values, the rendered templates
+    and the command templates, which identifies simulations with identical inputs across batches.
+        """
+        import hashlib
+        import json
+        from simunator.templating import render
+
+        contents = {}
+        simhash = hashlib.sha256(json.dumps([paramdict[param] for param in self.params]).encode())
+        simhash.update(self.commandkey)
+        for fname, templatestr in self.templatestrs.items():
+            simhash.update(fname.encode() + b"\0")
+            if fname in self.sharedfiles:
+                # Shared files are named after the sha256 of their content
+                simhash.update(os.path.basename(self.sharedfiles[fname]).encode())
+                continue
+            with self.timer.phase("render"):
+                contents[fname] = render(templatestr, **paramdict)
+            simhash.update(hashlib.sha256(contents[fname].encode()).hexdigest().encode())
+        paramdict["SIM_HASH"] = simhash.hexdigest()
+
+        source = self.knownpaths.get(paramdict["SIM_HASH"])
+        if source and os.path.isdir(source) and not os.path.exists(paramdict["SIM_PATH"]):
+            with self.timer.phase("reuse"):
+                self.reuse_sim(source, paramdict["SIM_PATH"])
+            return paramdict["SIM_PATH"]
+
+        with self.timer.phase("files"):
+            os.makedirs(paramdict["SIM_PATH"], exist_ok=True)
+
+        for fname in self.templatestrs:
+            ofile = os.path.join(paramdict["SIM_PATH"], fname)
+            if fname in self.sharedfiles:
+                with self.timer.phase("files"):
+                    if self.link_shared(self.sharedfiles[fname], ofile):
+                        continue
+                with self.timer.phase("render"):
+                    contents[fname] = render(self.templatestrs[fname], **paramdict)
+            with self.timer.phase("files"):
                 with open(ofile, "w") as f:
-                    f.write(tm.render(**paramdict))
+                    f.write(contents[fname])
 
-            self.c.execute(
-                "INSERT INTO '{0}' ( {1} ) VALUES ( {2} );".format(
-                    self.currtime,
-                    ", ".join(paramdict.keys()),
-                    ("?, " * len(paramdict.values())).rstrip(", "),
-                ),
-                tuple(paramdict.values()),
-            )
+        return paramdict["SIM_PATH"]
+
+    def reuse_sim(self, source, path):
+        """Makes path a symlink to, or a copy of, the directory of an identical simulation."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.reuse == "link":
+            os.symlink(source, path)
+        else:
+            import shutil
+
+            shutil.copytree(source, path, symlinks=True)
+
+    def link_shared(self, sharedfile, ofile):
+        """Links ofile to the shared copy of its content. Returns False if linking is not
+    possible (e.g. hardlinks across filesystems) and the file should be written instead.
+        """
+        try:
+            if os.path.lexists(ofile):
+                os.remove(ofile)
+            if self.dedup == "symlink":
+                os.symlink(sharedfile, ofile)
+            else:
+                os.link(sharedfile, ofile)
+        except OSError:
+            return False
+        return True
+
+    def report_progress(self, paths, ncreated):
+        """Prints a progress line every 10% of the nsims simulations. Returns the updated
+    number of simulations created.
+        """
+        reportevery = max(1, self.nsims // 10)
+        for n, _ in enumerate(paths, ncreated + 1):
+            if n % reportevery == 0 or n == self.nsims:
+                print("Created {0}/{1} simulations ({2} files)".format(n, self.nsims, n * len(self.templatestrs)))
+            ncreated = n
+        return ncreated
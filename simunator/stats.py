@@ -0,0 +1,60 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (in seconds) of the latency histogram buckets shown by 'simunator stats'
+latency_buckets = [1e-3, 1e-2, 1e-1, 1.0, 10.0, 100.0, float("inf")]
+
+
+class PhaseTimer:
+    """Counts calls of, and accumulates the time spent in, the named phases of an action. Phases
+    timed from several threads at once add up, so their total can exceed the wall time.
+    """
+    def __init__(self):
+        self.counts = {}
+        self.seconds = {}
+        self.lock = threading.Lock()
+
+    def add(self, phase, seconds, count=1):
+        with self.lock:
+            self.counts[phase] = self.counts.get(phase, 0) + count
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def rows(self):
+        """Returns (phase, count, seconds) in the order the phases were first entered."""
+        return [(phase, self.counts[phase], self.seconds[phase]) for phase in self.counts]
+
+
+def histogram(latencies):
+    """Returns the number of latencies (in seconds) in each of the latency_buckets."""
+    counts = [0] * len(latency_buckets)
+    for latency in latencies:
+        counts[next(i for i, bound in enumerate(latency_buckets) if latency < bound)] += 1
+    return counts
+
+
+def percentile(ordered, q):
+    """Returns the q-th percentile (0 <= q <= 100) of a sorted list, by the nearest rank."""
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100.0 * len(ordered))) - 1))]
+
+
+def format_bound(seconds):
+    if seconds == float("inf"):
+        return "inf"
+    return "{0:g}ms".format(seconds * 1e3) if seconds < 1 else "{0:g}s".format(seconds)
+
+
+def print_profile(profile, limit=30, out=sys.stderr):
+    """Prints the limit most expensive functions of a cProfile.Profile by cumulative time."""
+    import pstats
+
+    pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(limit)
@@ -0,0 +1,28 @@
+import sqlite3
+
+# WAL lets readers (SimView, analysis scripts) keep working while collect/run write, and NORMAL
+# synchronous is safe in WAL mode. Note that WAL needs shared memory, so it does not work for
+# databases on network filesystems; use journal_mode="DELETE" there.
+pragmas = {
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -65536,
+}
+
+busy_timeout = 60.0
+
+
+def connect(db, journal_mode="WAL"):
+    """Opens the simunator database with sqlite3.Row rows and the pragmas above."""
+    conn = sqlite3.connect(db, timeout=busy_timeout)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = {0};".format(journal_mode))
+    for pragma, value in pragmas.items():
+        conn.execute("PRAGMA {0} = {1};".format(pragma, value))
+    return conn
+
+
+def index_columns(cursor, table, columns):
+    """Creates an index on each of the given columns of table, if missing."""
+    for column in columns:
+        cursor.execute("CREATE INDEX IF NOT EXISTS '{0}_{1}' ON '{0}' ( {1} );".format(table, column))
@@ -0,0 +1,12 @@
+import subprocess
+import time
+
+
+def run_task(cmd, path):
+    """Runs a single rendered command from path, returning (exit status, start time, end time)."""
+    start = time.time()
+    try:
+        status = subprocess.run(cmd, cwd=path, shell=True).returncode
+    except OSError:
+        status = -1
+    return status, start, time.time()
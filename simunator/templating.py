@@ -0,0 +1,18 @@
+from functools import lru_cache
+
+from jinja2 import Environment
+
+# Shared by every render in the process. jinja2.Template(source) parses and compiles source on
+# every call, which dominates create/listtasks/collect when the same few templates are rendered
+# for every simulation.
+environment = Environment()
+
+
+@lru_cache(maxsize=256)
+def get_template(source):
+    """Returns the compiled template for source, compiling it at most once per process."""
+    return environment.from_string(source)
+
+
+def render(source, **params):
+    return get_template(source).render(**params)